@@ -0,0 +1,92 @@
+import logging
+import math
+
+import faiss
+import numpy as np
+
+from config import (INDEX_TYPE, INDEX_IVF_NLIST, INDEX_NPROBE, INDEX_HNSW_M, INDEX_HNSW_EF_SEARCH,
+                    INDEX_PQ_M, INDEX_PQ_BITS)
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq", "ivfpq")
+
+# faiss wants about this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def build_settings(index_type=INDEX_TYPE):
+    """Settings that shape a built index; a change to any of them requires a rebuild."""
+    settings = {"index_type": index_type}
+    if index_type in ("ivf", "ivfpq"):
+        settings["ivf_nlist"] = INDEX_IVF_NLIST
+    if index_type == "hnsw":
+        settings["hnsw_m"] = INDEX_HNSW_M
+    if index_type in ("pq", "ivfpq"):
+        settings.update(pq_m=INDEX_PQ_M, pq_bits=INDEX_PQ_BITS)
+    return settings
+
+
+def pq_subquantizers(dim, m):
+    # The vector dimension must split evenly into the sub-quantizers
+    return max(d for d in range(1, min(m, dim) + 1) if dim % d == 0)
+
+
+def index_factory_string(n, dim, index_type=INDEX_TYPE, nlist=INDEX_IVF_NLIST, hnsw_m=INDEX_HNSW_M,
+                         pq_m=INDEX_PQ_M, pq_bits=INDEX_PQ_BITS):
+    """faiss index_factory description for `n` vectors, falling back to Flat when there is too little training data."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown INDEX_TYPE {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m},Flat"
+
+    ivf = ""
+    if index_type in ("ivf", "ivfpq"):
+        nlist = min(nlist or int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CENTROID)
+        if nlist < 2:
+            logger.warning(f"Only {n} vectors; too few to train an IVF index, using Flat.")
+            return "Flat"
+        ivf = f"IVF{nlist},"
+    if index_type == "ivf":
+        return f"{ivf}Flat"
+
+    # Use fewer bits per code when there are too few vectors to train 2**bits centroids
+    while pq_bits > 4 and n < MIN_POINTS_PER_CENTROID * 2 ** pq_bits:
+        pq_bits -= 1
+    if n < MIN_POINTS_PER_CENTROID * 2 ** pq_bits:
+        logger.warning(f"Only {n} vectors; too few to train a PQ index, using {ivf or 'Flat'}.")
+        return f"{ivf}Flat" if ivf else "Flat"
+    return f"{ivf}PQ{pq_subquantizers(dim, pq_m)}x{pq_bits}"
+
+
+def configure_search(index, nprobe=INDEX_NPROBE, ef_search=INDEX_HNSW_EF_SEARCH):
+    """Apply the query-time knobs that the index type supports."""
+    params = faiss.ParameterSpace()
+    if faiss.try_extract_index_ivf(index) is not None:
+        params.set_index_parameter(index, "nprobe", nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        params.set_index_parameter(index, "efSearch", ef_search)
+    return index
+
+
+def build_index(vectors, index_type=INDEX_TYPE, **kwargs):
+    """Train (if needed) and fill an index of the configured type with `vectors`, in order."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    description = index_factory_string(n, dim, index_type, **kwargs)
+    index = faiss.index_factory(dim, description)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    logger.info(f"Built {description} index over {n} vectors.")
+    return configure_search(index)
+
+
+def supports_positional_remove(index):
+    """Whether remove_ids renumbers the remaining vectors, as the LangChain FAISS wrapper assumes.
+
+    Only flat-code indexes (Flat, PQ) do; IVF keeps the old ids and HNSW cannot remove at all.
+    """
+    return isinstance(index, faiss.IndexFlatCodes)
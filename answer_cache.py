@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import threading
+import time
+
+import numpy as np
+
+from config import ANSWER_CACHE_ENABLED, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+
+def context_fingerprint(index_version, docs):
+    """Identify the retrieved context by the index snapshot and the best-ranked document chunk.
+
+    Interaction documents are ignored: every answered question adds one to the index, and one
+    ranking above the chunks would otherwise change the fingerprint of a repeated question.
+    """
+    top_chunk = next(
+        (doc.metadata["chunk_id"] for doc in docs or []
+         if "chunk_id" in doc.metadata and doc.metadata.get("source") != "user_interaction"),
+        "",
+    )
+    return hashlib.sha256(f"{index_version}\0{top_chunk}".encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """Answers keyed by question embedding and context fingerprint.
+
+    A lookup hits when a stored question has cosine similarity of at least `threshold` with the
+    incoming one, its entry has not expired, and it was answered from the same retrieved context.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, enabled=ANSWER_CACHE_ENABLED):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = []
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        # Interactions served from (or stored into) an entry, so feedback can reach it
+        self._by_interaction = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _rebuild(self, entries):
+        self._entries = entries
+        self._vectors = np.stack([entry["vector"] for entry in entries]) if entries else np.empty((0, 0), dtype=np.float32)
+        live = {id(entry) for entry in entries}
+        self._by_interaction = {k: e for k, e in self._by_interaction.items() if id(e) in live}
+
+    def lookup(self, question_vector, context_key):
+        if not self.enabled:
+            return None
+        vector = self._normalize(question_vector)
+        now = time.time()
+        with self._lock:
+            if any(now - entry["created_at"] > self.ttl for entry in self._entries):
+                self._rebuild([entry for entry in self._entries if now - entry["created_at"] <= self.ttl])
+            if self._entries and self._vectors.shape[1] == vector.shape[0]:
+                scores = self._vectors @ vector
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    entry = self._entries[i]
+                    if entry["context_key"] == context_key:
+                        self.hits += 1
+                        return entry
+            self.misses += 1
+            return None
+
+    def store(self, question, question_vector, context_key, answer, interaction_id):
+        if not self.enabled:
+            return
+        entry = {
+            "question": question,
+            "vector": self._normalize(question_vector),
+            "context_key": context_key,
+            "answer": answer,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            entries = self._entries + [entry]
+            if len(entries) > self.max_entries:
+                entries = entries[-self.max_entries:]
+            self._by_interaction[interaction_id] = entry
+            self._rebuild(entries)
+
+    def link(self, interaction_id, entry):
+        with self._lock:
+            self._by_interaction[interaction_id] = entry
+
+    def invalidate_interaction(self, interaction_id):
+        with self._lock:
+            entry = self._by_interaction.get(interaction_id)
+            if entry is None:
+                return False
+            self._rebuild([e for e in self._entries if e is not entry])
+            logger.info(f"Evicted cached answer for question: {entry['question'][:100]}")
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._by_interaction = {}
+            self._rebuild([])
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+answer_cache = SemanticAnswerCache()
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, Response, stream_with_context
 import requests
 import os
 import logging
@@ -17,11 +17,11 @@ logger = logging.getLogger(__name__)
 
 
 # Function to call API
-def call_api(endpoint, method="GET", data=None):
+def call_api(endpoint, method="GET", data=None, params=None):
     url = f"{API_URL}{endpoint}"
     try:
         if method == "GET":
-            response = requests.get(url, timeout=30)
+            response = requests.get(url, params=params, timeout=30)
         elif method == "POST":
             response = requests.post(url, json=data, timeout=30)
         elif method == "DELETE":
@@ -51,6 +51,31 @@ def ask():
     return jsonify(response)
 
 
+@app.route("/ask/stream", methods=["POST"])
+def ask_stream():
+    data = request.json
+    try:
+        upstream = requests.post(f"{API_URL}/ask/stream", json=data, stream=True, timeout=30)
+        upstream.raise_for_status()
+    except requests.RequestException as e:
+        logger.error(f"API call error: {str(e)}")
+        return jsonify({"error": f"Error calling API: {str(e)}"}), 502
+
+    def generate():
+        # Forward each chunk as soon as it arrives instead of buffering the whole answer
+        try:
+            for chunk in upstream.iter_content(chunk_size=None):
+                yield chunk
+        finally:
+            upstream.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.route("/feedback", methods=["POST"])
 def feedback():
     data = request.json
@@ -67,13 +92,13 @@ def feedback():
 
 @app.route("/chat_history")
 def chat_history():
-    response = call_api("/chat_history")
+    response = call_api("/chat_history", params=request.args)
     return jsonify(response)
 
 
 @app.route("/conversation/<conversation_id>")
 def get_conversation(conversation_id):
-    response = call_api(f"/conversation/{conversation_id}")
+    response = call_api(f"/conversation/{conversation_id}", params=request.args)
     return jsonify(response)
 
 
@@ -103,17 +128,26 @@ def send_static(path):
     return send_from_directory("static", path)
 
 
-fastapi_process = subprocess.Popen(
-    ["uvicorn", "main:app", "--host", "127.0.0.1", "--port", "8050"]
-)
+def start_api():
+    """Run the FastAPI backend as a child process, stopped when this process exits."""
+    fastapi_process = subprocess.Popen(
+        ["uvicorn", "main:app", "--host", "127.0.0.1", "--port", "8050"]
+    )
 
+    def cleanup():
+        fastapi_process.send_signal(signal.SIGINT)
+        fastapi_process.wait()
 
-def cleanup():
-    fastapi_process.send_signal(signal.SIGINT)
-    fastapi_process.wait()
+    atexit.register(cleanup)
+    return fastapi_process
 
 
-atexit.register(cleanup)
+# Importing this module (e.g. from a WSGI server) no longer starts the API; set SPAWN_API=true
+# for hosts that relied on that. Under the debug reloader only the watching parent spawns it,
+# so code reloads do not start a second API.
+if (__name__ == "__main__" or os.getenv("SPAWN_API", "false").lower() == "true") \
+        and os.getenv("WERKZEUG_RUN_MAIN") != "true":
+    start_api()
 
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,92 @@
+"""Recall/latency/memory comparison of the INDEX_TYPE options on a synthetic corpus.
+
+Builds each index type with the same code the app uses (ann_index.build_index) over
+clustered random vectors shaped like text embeddings, then reports, per type, recall@k
+against exact flat search, single-query p50/p99 latency, build time and serialized size
+(a close proxy for resident memory). Use it to pick INDEX_TYPE and its knobs for a
+given corpus size.
+
+    python benchmarks/ann_benchmark.py --vectors 50000 --dim 1536 --types flat ivf hnsw pq ivfpq
+    python benchmarks/ann_benchmark.py --types ivf --nprobe 16
+"""
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import INDEX_TYPES, build_index, configure_search, index_factory_string  # noqa: E402
+
+
+def synthetic_vectors(n, dim, clusters, rng):
+    # Unit vectors scattered around random centres, like embeddings of related text
+    centres = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = centres[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run_type(index_type, corpus, queries, truth, k, nprobe, ef_search):
+    start = time.perf_counter()
+    index = build_index(corpus, index_type)
+    build_seconds = time.perf_counter() - start
+    configure_search(index, nprobe=nprobe, ef_search=ef_search)
+
+    latencies = []
+    hits = 0
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(ids[0]) & set(truth[i]))
+
+    return {
+        "type": index_type,
+        "description": index_factory_string(len(corpus), corpus.shape[1], index_type),
+        "recall": hits / (len(queries) * k),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "build_s": build_seconds,
+        "size_mb": faiss.serialize_index(index).nbytes / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    corpus = synthetic_vectors(args.vectors, args.dim, args.clusters, rng)
+    queries = synthetic_vectors(args.queries, args.dim, args.clusters, rng)
+
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(corpus)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"{args.vectors} vectors, dim {args.dim}, {args.queries} queries, recall@{args.k} vs exact search")
+    print(f"{'type':>6} {'index':>16} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8} {'size MB':>8}")
+    for index_type in args.types:
+        r = run_type(index_type, corpus, queries, truth, args.k, args.nprobe, args.ef_search)
+        print(f"{r['type']:>6} {r['description']:>16} {r['recall']:>7.3f} {r['p50_ms']:>8.3f} "
+              f"{r['p99_ms']:>8.3f} {r['build_s']:>8.2f} {r['size_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
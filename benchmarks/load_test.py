@@ -0,0 +1,75 @@
+"""Concurrent load test for the /ask endpoint.
+
+Sends the same number of questions at increasing concurrency levels against a running
+API and reports throughput and latency for each level. With a non-blocking request path
+throughput should grow with concurrency until the LLM or DB becomes the bottleneck,
+instead of staying flat as it does when one request blocks the event loop.
+
+    uvicorn main:app --port 8050
+    python benchmarks/load_test.py --url http://127.0.0.1:8050 --requests 64 --concurrency 1 4 16
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+DEFAULT_QUESTIONS = [
+    "When is enrolment?",
+    "How do I get my student ID card?",
+    "What support is available for international students?",
+    "Where is the library?",
+]
+
+
+async def run_level(client, url, questions, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/ask", json={"question": questions[i % len(questions)]})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except httpx.HTTPError:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_s": statistics.median(latencies) if latencies else 0.0,
+        "p95_s": p95,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8050")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        print(f"{'concurrency':>11} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 s':>8} {'p95 s':>8}")
+        for concurrency in args.concurrency:
+            r = await run_level(client, args.url, DEFAULT_QUESTIONS, args.requests, concurrency)
+            print(f"{r['concurrency']:>11} {r['requests']:>8} {r['errors']:>6} {r['throughput_rps']:>8.2f} "
+                  f"{r['p50_s']:>8.3f} {r['p95_s']:>8.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
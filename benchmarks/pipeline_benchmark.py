@@ -0,0 +1,221 @@
+"""Offline end-to-end benchmark of the /ask pipeline and retrieval evaluation.
+
+Runs the real FastAPI app in-process with MODEL_BACKEND=local (a hashing embedder and a
+templated chat model from local_models.py), a throwaway index directory and a throwaway
+Postgres schema, so nothing calls OpenAI and no existing data is touched. Reports:
+
+  - retrieval hit-rate@k and MRR on a labeled question set, for vector, lexical and hybrid
+    retrieval (a question hits when one of its expected strings is in a top-k chunk),
+  - throughput and latency of /ask at each concurrency level, how often the answer itself
+    contains an expected string, and LLM tokens per call,
+  - per-stage latency (db, embed, search, generate, persist) from the app's stage timers.
+
+Run it before and after changing chunking, retrieval or prompt assembly. DATABASE_URL must
+point at a Postgres server; the bench_* schema is dropped afterwards.
+
+    python benchmarks/pipeline_benchmark.py
+    python benchmarks/pipeline_benchmark.py --requests 200 --concurrency 1 8 32 --llm-latency 0.5
+    CHUNK_SIZE=1000 python benchmarks/pipeline_benchmark.py --min-hit-rate 0.8
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+import psycopg2
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+
+
+def load_questions(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def squash(text):
+    # PDF extraction breaks lines and spaces unpredictably, so compare without whitespace
+    return re.sub(r"\s+", "", text).lower()
+
+
+def first_hit(texts, expected):
+    """1-based rank of the first text containing an expected string, or None."""
+    needles = [squash(e) for e in expected]
+    for rank, text in enumerate(texts, start=1):
+        haystack = squash(text)
+        if any(needle in haystack for needle in needles):
+            return rank
+    return None
+
+
+def evaluate_retrieval(index_manager, questions, k):
+    results = {}
+    for mode in RETRIEVAL_MODES:
+        index_manager.RETRIEVAL_MODE = mode
+        ranks = []
+        for q in questions:
+            query_vector = index_manager.embeddings.embed_query(q["question"]) if mode != "lexical" else None
+            docs = index_manager.retrieve_documents(query_vector, q["question"], k=k) or []
+            ranks.append(first_hit([doc.page_content for doc in docs], q["expected"]))
+        results[mode] = {
+            "hit_rate": sum(rank is not None for rank in ranks) / len(ranks),
+            "mrr": sum(1 / rank for rank in ranks if rank) / len(ranks),
+            "misses": [q["question"] for q, rank in zip(questions, ranks) if rank is None],
+        }
+    return results
+
+
+async def run_level(client, questions, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    answer_hits = 0
+
+    async def one(i):
+        nonlocal errors, answer_hits
+        q = questions[i % len(questions)]
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post("/ask", json={"question": q["question"]})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+                answer_hits += first_hit([response.json()["answer"]], q["expected"]) is not None
+            except httpx.HTTPError:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_s": statistics.median(latencies) if latencies else 0.0,
+        "p95_s": latencies[max(0, int(len(latencies) * 0.95) - 1)] if latencies else 0.0,
+        "answer_hit_rate": answer_hits / len(latencies) if latencies else 0.0,
+    }
+
+
+async def run_benchmark(args, questions):
+    import index_manager
+    import main
+    from observability import STAGES, stage_timings
+    from prometheus_client import REGISTRY
+
+    # Load the index and model as the startup hook would, without its background loops
+    if not await main.warm_up():
+        raise SystemExit(f"The app failed to warm up: {main.warmup['error']}")
+    # httpx logs every benchmark request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    configured_mode = index_manager.RETRIEVAL_MODE
+    retrieval = evaluate_retrieval(index_manager, questions, args.k)
+    index_manager.RETRIEVAL_MODE = configured_mode
+
+    print(f"\nRetrieval on {len(questions)} labeled questions, top {args.k} chunks")
+    print(f"{'mode':>8} {'hit@k':>7} {'MRR':>7}")
+    for mode, r in retrieval.items():
+        print(f"{mode:>8} {r['hit_rate']:>7.3f} {r['mrr']:>7.3f}")
+    for question in retrieval[configured_mode]["misses"]:
+        print(f"  miss ({configured_mode}): {question}")
+
+    print(f"\n/ask throughput, retrieval mode {configured_mode}, LLM latency {args.llm_latency}s")
+    print(f"{'concurrency':>11} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 s':>8} {'p95 s':>8} {'answer hit':>10}")
+    stage_timings.reset()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+        for concurrency in args.concurrency:
+            r = await run_level(client, questions, args.requests, concurrency)
+            print(f"{r['concurrency']:>11} {r['requests']:>8} {r['errors']:>6} {r['throughput_rps']:>8.2f} "
+                  f"{r['p50_s']:>8.3f} {r['p95_s']:>8.3f} {r['answer_hit_rate']:>10.3f}")
+
+    calls = stage_timings.snapshot().get("generate", {}).get("count", 0)
+    if calls:
+        prompt = REGISTRY.get_sample_value("dmu_llm_tokens_total", {"kind": "prompt"}) or 0
+        completion = REGISTRY.get_sample_value("dmu_llm_tokens_total", {"kind": "completion"}) or 0
+        print(f"\nLLM tokens per call (local model counts words): prompt {prompt / calls:.0f}, "
+              f"completion {completion / calls:.0f}")
+
+    stages = stage_timings.snapshot()
+    print("\nPer-stage latency across all levels")
+    print(f"{'stage':>8} {'calls':>7} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for stage in STAGES:
+        s = stages.get(stage)
+        if s:
+            print(f"{stage:>8} {s['count']:>7} {s['mean_ms']:>8.2f} {s['p50_ms']:>8.2f} "
+                  f"{s['p95_ms']:>8.2f} {s['max_ms']:>8.2f}")
+
+    return retrieval[configured_mode]["hit_rate"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", default=os.path.join(ROOT, "benchmarks", "questions.jsonl"))
+    parser.add_argument("--upload-dir", default=os.path.join(ROOT, "upload"))
+    parser.add_argument("--index-dir", help="reuse this index directory instead of building in a temporary one")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds added to each local LLM call")
+    parser.add_argument("--answer-cache", action="store_true", help="leave the semantic answer cache on")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--min-hit-rate", type=float, help="exit non-zero when hit@k falls below this")
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(ROOT, ".env"))
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        parser.error("DATABASE_URL must point at a Postgres server")
+
+    # Settings are read when the app modules are imported, so set them all first
+    schema = f"bench_{uuid.uuid4().hex[:12]}"
+    index_dir = args.index_dir or tempfile.mkdtemp(prefix="dmu-bench-index-")
+    os.environ.update({
+        "MODEL_BACKEND": "local",
+        "DB_SCHEMA": schema,
+        "INDEX_DIR": index_dir,
+        "UPLOAD_DIR": args.upload_dir,
+        "LOCAL_LLM_LATENCY": str(args.llm_latency),
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+    })
+    os.environ.pop("INTERACTION_INDEX_DIR", None)
+    os.environ.pop("EMBEDDING_MODEL", None)
+    os.environ.setdefault("API_URL", "http://127.0.0.1:8050")
+
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+    try:
+        hit_rate = asyncio.run(run_benchmark(args, load_questions(args.questions)))
+    finally:
+        from db_pool import get_pool
+        get_pool().closeall()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.close()
+        if not args.index_dir:
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+    if args.min_hit_rate is not None and hit_rate < args.min_hit_rate:
+        print(f"\nhit@{args.k} {hit_rate:.3f} is below the required {args.min_hit_rate:.3f}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Startup benchmark: how long the API takes to accept connections and to become ready.
+
+Starts `uvicorn main:app` as a subprocess several times with MODEL_BACKEND=local and a
+throwaway Postgres schema, and polls it until it answers /healthz (live) and then /readyz
+(ready). Reports for each run:
+
+  - live: seconds from spawning the process until it serves HTTP,
+  - ready: seconds until /readyz returns 200, i.e. the index and caches are warm,
+  - the warm-up steps reported by /readyz.
+
+An app without /readyz counts as ready as soon as it is live. By default every run reuses
+one index directory, built by the first run, which is the rolling-deploy case; pass --cold
+to start each run from an empty index directory.
+
+    python benchmarks/startup_benchmark.py
+    python benchmarks/startup_benchmark.py --runs 5 --index-dir /tmp/dmu-index
+    python benchmarks/startup_benchmark.py --cold --runs 1
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+import psycopg2
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for(url, deadline, accept):
+    """Seconds-since-epoch of the first response `accept` approves, or None at the deadline."""
+    while time.time() < deadline:
+        try:
+            response = httpx.get(url, timeout=1.0)
+            if accept(response):
+                return time.time(), response
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    return None, None
+
+
+def run_once(env, port, timeout, log_path):
+    with open(log_path, "w") as log:
+        start = time.time()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            deadline = start + timeout
+            base = f"http://127.0.0.1:{port}"
+            live_at, _ = wait_for(f"{base}/healthz", deadline, lambda r: True)
+            if live_at is None:
+                return None
+            ready_at, response = wait_for(f"{base}/readyz", deadline, lambda r: r.status_code in (200, 404))
+            steps = response.json().get("steps", {}) if ready_at and response.status_code == 200 else {}
+            return {"live_s": live_at - start, "ready_s": (ready_at or deadline) - start,
+                    "ready": ready_at is not None, "steps": steps}
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--upload-dir", default=os.path.join(ROOT, "upload"))
+    parser.add_argument("--index-dir", help="reuse this index directory instead of a temporary one")
+    parser.add_argument("--cold", action="store_true", help="start every run from an empty index directory")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds to wait for each run to become ready")
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(ROOT, ".env"))
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        parser.error("DATABASE_URL must point at a Postgres server")
+
+    schema = f"bench_{uuid.uuid4().hex[:12]}"
+    index_dir = args.index_dir or tempfile.mkdtemp(prefix="dmu-startup-index-")
+    env = dict(os.environ, MODEL_BACKEND="local", DB_SCHEMA=schema, INDEX_DIR=index_dir, UPLOAD_DIR=args.upload_dir)
+    for name in ("INTERACTION_INDEX_DIR", "EMBEDDING_MODEL", "INDEX_ROLE"):
+        env.pop(name, None)
+
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+    results = []
+    try:
+        for run in range(args.runs):
+            if args.cold:
+                shutil.rmtree(index_dir, ignore_errors=True)
+            log_path = os.path.join(tempfile.gettempdir(), f"dmu-startup-{run}.log")
+            result = run_once(env, args.port, args.timeout, log_path)
+            if result is None:
+                print(f"run {run + 1}: the app did not start within {args.timeout}s; see {log_path}")
+                continue
+            results.append(result)
+            steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in result["steps"].items())
+            print(f"run {run + 1}: live {result['live_s']:.2f}s, ready {result['ready_s']:.2f}s"
+                  f"{'' if result['ready'] else ' (timed out)'}{f' [{steps}]' if steps else ''}")
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.close()
+        if not args.index_dir:
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+    # The first warm run builds the index, so report it apart from the rest
+    warm = results[1:] if not args.cold and len(results) > 1 else results
+    if warm:
+        print(f"\nmedian over {len(warm)} {'cold' if args.cold else 'warm'} runs: "
+              f"live {statistics.median(r['live_s'] for r in warm):.2f}s, "
+              f"ready {statistics.median(r['ready_s'] for r in warm):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
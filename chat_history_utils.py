@@ -1,14 +1,12 @@
-import psycopg2
-from psycopg2 import pool
 import os
 from langchain_community.chat_message_histories import PostgresChatMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage
+from database_manager import get_recent_history
+from db_pool import get_pool
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
-
-# Create a connection pool
-connection_pool = psycopg2.pool.SimpleConnectionPool(1, 20, DATABASE_URL)
-
 def get_chat_history(session_id: str):
     history = PostgresChatMessageHistory(
         session_id=session_id,
@@ -17,14 +15,37 @@ def get_chat_history(session_id: str):
     )
     return history.messages
 
+class CachedChatMessageHistory(BaseChatMessageHistory):
+    """Message history for the chain, read from the shared conversation history cache.
+
+    The prompt history is rebuilt from the conversation's recent interactions, so the chain
+    does not read the conversation again. Nothing is written here: finish_turn stores each
+    turn as an interaction, which is where the history is read from.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+
+    @property
+    def messages(self):
+        messages = []
+        for question, answer, _ in get_recent_history(self.session_id):
+            messages.append(HumanMessage(content=question))
+            messages.append(AIMessage(content=answer))
+        return messages
+
+    def add_messages(self, messages):
+        pass
+
+    def clear(self):
+        # Conversations are removed with delete_conversation
+        pass
+
 def query_chat_history(query: str, params: tuple = ()):
-    conn = connection_pool.getconn()
-    try:
+    with get_pool().connection() as conn:
         with conn.cursor() as cur:
             cur.execute(query, params)
             return cur.fetchall()
-    finally:
-        connection_pool.putconn(conn)
 
     
 # Example queries
@@ -32,8 +53,8 @@ def get_all_sessions():
     return query_chat_history("SELECT DISTINCT session_id FROM chat_messages")
 
 def get_messages_for_session(session_id: str):
-    return query_chat_history("SELECT message_type, content, timestamp FROM chat_messages WHERE session_id = ? ORDER BY timestamp", (session_id,))
+    return query_chat_history("SELECT message_type, content, timestamp FROM chat_messages WHERE session_id = %s ORDER BY timestamp", (session_id,))
 
 def get_recent_messages(limit: int = 10):
-    return query_chat_history("SELECT session_id, message_type, content, timestamp FROM chat_messages ORDER BY timestamp DESC LIMIT ?", (limit,))
+    return query_chat_history("SELECT session_id, message_type, content, timestamp FROM chat_messages ORDER BY timestamp DESC LIMIT %s", (limit,))
 
@@ -1,10 +1,134 @@
 import os
 from dotenv import load_dotenv
 
+load_dotenv()
+
+# Conversation history settings
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "6"))
+HISTORY_CACHE_CONVERSATIONS = int(os.getenv("HISTORY_CACHE_CONVERSATIONS", "10000"))
+HISTORY_CACHE_BYTES = int(os.getenv("HISTORY_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# Semantic answer cache settings
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+# Database settings
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING_AFTER = float(os.getenv("DB_POOL_PRE_PING_AFTER", "30"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+
+# Answer improvement worker settings
+IMPROVEMENT_INTERVAL = int(os.getenv("IMPROVEMENT_INTERVAL", "3600"))
+IMPROVEMENT_NEGATIVE_RATIO = float(os.getenv("IMPROVEMENT_NEGATIVE_RATIO", "0.3"))
+IMPROVEMENT_CONCURRENCY = int(os.getenv("IMPROVEMENT_CONCURRENCY", "4"))
+IMPROVEMENT_BATCH_SIZE = int(os.getenv("IMPROVEMENT_BATCH_SIZE", "20"))
+IMPROVEMENT_LEASE_SECONDS = int(os.getenv("IMPROVEMENT_LEASE_SECONDS", "300"))
+IMPROVEMENT_MAX_ATTEMPTS = int(os.getenv("IMPROVEMENT_MAX_ATTEMPTS", "3"))
+IMPROVEMENT_MAX_POOL_SATURATION = float(os.getenv("IMPROVEMENT_MAX_POOL_SATURATION", "0.5"))
+
+# Document ingestion settings
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "upload")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "16"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+# Interaction ingestion queue settings
+INDEX_INGEST_INTERVAL = float(os.getenv("INDEX_INGEST_INTERVAL", "30"))
+INDEX_INGEST_DELAY = float(os.getenv("INDEX_INGEST_DELAY", "2"))
+
+# Vector index settings
+INDEX_DIR = os.getenv("INDEX_DIR", "index")
+# Workers (INDEX_ROLE=worker) memory-map IVF snapshots so they share the inverted lists' pages
+INDEX_MMAP = os.getenv("INDEX_MMAP", "true").lower() == "true"
+INDEX_KEEP_SNAPSHOTS = int(os.getenv("INDEX_KEEP_SNAPSHOTS", "3"))
+# A rebuilt corpus snapshot is only published and swapped in if it passes validation: it keeps at least
+# INDEX_MIN_DOC_RATIO of the live index's chunks, a sample of its chunks retrieves themselves, and each
+# "|"-separated INDEX_PROBE_QUERIES query returns results
+INDEX_MIN_DOC_RATIO = float(os.getenv("INDEX_MIN_DOC_RATIO", "0.5"))
+INDEX_PROBE_SAMPLE = int(os.getenv("INDEX_PROBE_SAMPLE", "20"))
+INDEX_PROBE_MIN_RECALL = float(os.getenv("INDEX_PROBE_MIN_RECALL", "0.9"))
+INDEX_PROBE_QUERIES = [q.strip() for q in os.getenv("INDEX_PROBE_QUERIES", "").split("|") if q.strip()]
+# Required as the X-Admin-Token header by the /admin endpoints, which are disabled when it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "2000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+
+# Model backend: "openai", or "local" for the deterministic stand-ins in local_models.py used by
+# benchmarks and offline runs. Local embeddings get their own model name so they never share
+# cached vectors or index snapshots with the real ones.
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "openai").lower()
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "384"))
+LOCAL_LLM_LATENCY = float(os.getenv("LOCAL_LLM_LATENCY", "0"))
+EMBEDDING_MODEL = os.getenv(
+    "EMBEDDING_MODEL",
+    f"local-hashing-{LOCAL_EMBEDDING_DIM}" if MODEL_BACKEND == "local" else "text-embedding-ada-002",
+)
+
+# Approximate nearest-neighbour settings for the corpus index: flat, ivf, hnsw, pq or ivfpq
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat").lower()
+INDEX_IVF_NLIST = int(os.getenv("INDEX_IVF_NLIST", "0"))  # 0 picks about 4 * sqrt(n)
+INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", "8"))
+INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", "32"))
+INDEX_HNSW_EF_SEARCH = int(os.getenv("INDEX_HNSW_EF_SEARCH", "64"))
+INDEX_PQ_M = int(os.getenv("INDEX_PQ_M", "64"))
+INDEX_PQ_BITS = int(os.getenv("INDEX_PQ_BITS", "8"))
+
+# Context assembly settings: up to CONTEXT_CANDIDATES retrieved chunks are deduplicated and
+# packed, best first, into CONTEXT_TOKEN_BUDGET tokens together with the helpful past answers
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "5"))
+CONTEXT_TOKENIZER_ENCODING = os.getenv("CONTEXT_TOKENIZER_ENCODING", "cl100k_base")
+
+# Few-shot example settings: up to EXAMPLE_COUNT helpful past answers whose questions are at least
+# EXAMPLE_MIN_SIMILARITY similar to the incoming one are added to the context
+EXAMPLE_COUNT = int(os.getenv("EXAMPLE_COUNT", "3"))
+EXAMPLE_MIN_SIMILARITY = float(os.getenv("EXAMPLE_MIN_SIMILARITY", "0.8"))
+EXAMPLE_STORE_MAX_ENTRIES = int(os.getenv("EXAMPLE_STORE_MAX_ENTRIES", "1000"))
+
+# Retrieval settings: hybrid fuses vector and BM25 results; vector or lexical use one of them
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "10"))
+RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+RETRIEVAL_EMBED_TIMEOUT = float(os.getenv("RETRIEVAL_EMBED_TIMEOUT", "3"))
+
+# Interaction segment settings
+INTERACTION_INDEX_DIR = os.getenv("INTERACTION_INDEX_DIR", os.path.join(INDEX_DIR, "interactions"))
+INTERACTION_INDEX_MAX_DOCS = int(os.getenv("INTERACTION_INDEX_MAX_DOCS", "5000"))
+INTERACTION_INDEX_MAX_AGE_DAYS = int(os.getenv("INTERACTION_INDEX_MAX_AGE_DAYS", "90"))
+INTERACTION_DEDUP_THRESHOLD = float(os.getenv("INTERACTION_DEDUP_THRESHOLD", "0.95"))
+INTERACTION_COMPACT_INTERVAL = float(os.getenv("INTERACTION_COMPACT_INTERVAL", "3600"))
+INTERACTION_SEARCH_MAX = int(os.getenv("INTERACTION_SEARCH_MAX", "1"))
+
+# Multi-process deployment: "standalone" builds and serves the index in one process. To run several
+# API workers, start one index_builder.py process and set INDEX_ROLE=worker for the API processes;
+# workers never build, and swap in each snapshot the builder publishes to the shared INDEX_DIR
+INDEX_ROLE = os.getenv("INDEX_ROLE", "standalone").lower()
+INDEX_POLL_INTERVAL = float(os.getenv("INDEX_POLL_INTERVAL", "5"))
+INDEX_SYNC_INTERVAL = float(os.getenv("INDEX_SYNC_INTERVAL", "300"))
+
+# Embedding cache settings
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "true").lower() == "true"
+
+# Logging and metrics settings: question, context and answer payloads are only logged at DEBUG,
+# for this fraction of requests
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+# With several API workers (uvicorn --workers N), point PROMETHEUS_MULTIPROC_DIR at a directory shared
+# by them and emptied before each start, so /metrics reports every worker rather than the one scraped
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+METRICS_REFRESH_INTERVAL = float(os.getenv("METRICS_REFRESH_INTERVAL", "15"))
+
 def load_environment():
     load_dotenv()
     
     critical_vars = ['OPENAI_API_KEY', 'DATABASE_URL', 'API_URL']
+    if MODEL_BACKEND == "local":
+        critical_vars.remove('OPENAI_API_KEY')
     missing_vars = []
 
     for var in critical_vars:
@@ -19,4 +143,4 @@ def load_environment():
         raise ValueError(f"Missing critical environment variables: {', '.join(missing_vars)}. Please set these in your .env file or environment.")
 
     # Optional: Log successful loading of environment variables
-    print("Environment variables loaded successfully.")
\ No newline at end of file
+    print("Environment variables loaded successfully.")
@@ -0,0 +1,130 @@
+import logging
+import threading
+
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_TOKENIZER_ENCODING
+
+logger = logging.getLogger(__name__)
+
+# Shorter lines ("Answer:", bullets, headings) are always kept, so dedup never garbles structure
+MIN_DEDUP_LINE_CHARS = 24
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """The tiktoken encoding, or None when it cannot be loaded (e.g. offline without a cached BPE file)."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER_ENCODING)
+                except Exception as e:
+                    logger.warning(f"Cannot load the {CONTEXT_TOKENIZER_ENCODING} tokenizer ({e}); estimating tokens as characters / 4.")
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def add_token_counts(documents):
+    # Done once at ingest so context assembly does not tokenize whole chunks on every request
+    for document in documents:
+        document.metadata["token_count"] = count_tokens(document.page_content)
+    return documents
+
+
+def normalize_line(line):
+    return " ".join(line.lower().split())
+
+
+def new_lines(text, seen):
+    """Lines of `text` not already in `seen`, which is updated.
+
+    Consecutive chunks share CHUNK_OVERLAP characters and FAQ answers repeat across pages,
+    so line-level dedup drops both without comparing whole chunks.
+    """
+    kept = []
+    for line in text.splitlines():
+        key = normalize_line(line)
+        if not key:
+            continue
+        if len(key) >= MIN_DEDUP_LINE_CHARS:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(line)
+    return kept
+
+
+def truncate_lines(lines, budget):
+    kept = []
+    used = 0
+    for line in lines:
+        tokens = count_tokens(line) + 1
+        if used + tokens > budget:
+            break
+        kept.append(line)
+        used += tokens
+    return kept, used
+
+
+def pack_context(docs, history=(), examples=(), conversation_id=None, budget=CONTEXT_TOKEN_BUDGET):
+    """Greedily pack retrieved chunks, then examples, into `budget` tokens, best first.
+
+    `history` is the conversation the model already receives as messages: its lines are
+    never repeated here, and interaction documents from `conversation_id` are skipped.
+    A chunk that does not fit is skipped in favour of smaller, lower-ranked ones, except the
+    top chunk, which is truncated rather than dropped. Returns (context, packed docs, tokens used).
+    """
+    seen = set()
+    for question, answer, *_ in history:
+        new_lines(f"{question}\n{answer}", seen)
+    history_questions = {normalize_line(question) for question, *_ in history}
+
+    parts = []
+    packed_docs = []
+    used = 0
+    for doc in docs:
+        if conversation_id is not None and doc.metadata.get("conversation_id") == conversation_id:
+            continue
+        lines = new_lines(doc.page_content, seen)
+        if not lines:
+            continue
+        if len(lines) == len([line for line in doc.page_content.splitlines() if line.strip()]):
+            tokens = doc.metadata.get("token_count") or count_tokens(doc.page_content)
+        else:
+            tokens = count_tokens("\n".join(lines))
+        if used + tokens > budget:
+            if packed_docs:
+                continue
+            lines, tokens = truncate_lines(lines, budget)
+            if not lines:
+                continue
+        parts.append(f"Document {len(packed_docs) + 1}:\n" + "\n".join(lines))
+        packed_docs.append(doc)
+        used += tokens
+
+    example_parts = []
+    for question, answer in examples:
+        if normalize_line(question) in history_questions:
+            continue
+        text = f"Q: {question}\nA: {answer}"
+        tokens = count_tokens(text)
+        if used + tokens > budget:
+            continue
+        example_parts.append(text)
+        used += tokens
+
+    context = "Relevant context:\n" + "\n\n".join(parts)
+    if example_parts:
+        context += "\n\nHelpful past answers:\n" + "\n\n".join(example_parts)
+    return context, packed_docs, used
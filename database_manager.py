@@ -1,9 +1,18 @@
 import psycopg2
-from psycopg2 import pool
+from psycopg2.extras import execute_values
+import base64
+import json
 import os
+import time
+from datetime import datetime
 from dotenv import load_dotenv
 import logging
+from contextlib import contextmanager
 from urllib.parse import urlparse
+from config import HISTORY_WINDOW, INDEX_ROLE
+from db_pool import configure_pool, run_db
+from notifications import INSTANCE_ID, INVALIDATE_CHANNEL, INGEST_CHANNEL
+from history_cache import history_cache
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -19,27 +28,36 @@ if not DATABASE_URL:
 
 # Ensure DATABASE_URL is a string
 DATABASE_URL = os.getenv('DATABASE_URL')
-print(f"DATABASE_URL: {DATABASE_URL}")
 
 if isinstance(DATABASE_URL, bytes):
     DATABASE_URL = DATABASE_URL.decode('utf-8')
 
-# Create a connection pool
-connection_pool = psycopg2.pool.SimpleConnectionPool(1, 20, DATABASE_URL)
+schema = os.getenv('DB_SCHEMA', 'public')
+
+# All modules share one pool; search_path is set once when each connection is opened. The
+# application_name tags the notifications this process's writes cause, so it can skip them.
+SESSION_SETUP = [f"SET search_path TO {schema}", f"SET application_name TO '{INSTANCE_ID}'"]
+connection_pool = configure_pool(DATABASE_URL, session_setup=SESSION_SETUP)
+
+# Serializes init_db when several processes start at once
+INIT_DB_LOCK_KEY = 0x444D5502
 
 def execute_db_operation(operation, *args):
-    conn = connection_pool.getconn()
     try:
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(f"SET search_path TO {schema}")
-                result = operation(cur, *args)
-        return result
+        with connection_pool.connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    return operation(cur, *args)
     except psycopg2.Error as error:
         logger.error(f"Database error: {error}")
         raise
-    finally:
-        connection_pool.putconn(conn)
+
+def open_pool():
+    # Connections are otherwise opened by the first queries that need them
+    connection_pool.fill()
+
+def get_pool_stats():
+    return connection_pool.stats()
 
 def init_db():
     def _init(cursor):
@@ -62,42 +80,289 @@ def init_db():
             FOREIGN KEY (conversation_id) REFERENCES conversations(id)
         )
         ''')
+        # No longer written; kept so delete_conversation can remove rows from earlier versions
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id SERIAL PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            message JSONB NOT NULL
+        )
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_chat_history_session_id ON chat_history (session_id, id)
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            embedding REAL[] NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS improvement_jobs (
+            interaction_id INTEGER PRIMARY KEY REFERENCES interactions(id) ON DELETE CASCADE,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            claimed_by TEXT,
+            leased_until TIMESTAMP,
+            available_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_improvement_jobs_claimable
+        ON improvement_jobs (available_at) WHERE status IN ('pending', 'running')
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS index_ingest_queue (
+            id BIGSERIAL PRIMARY KEY,
+            interaction_id INTEGER REFERENCES interactions(id) ON DELETE CASCADE,
+            conversation_id TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at TIMESTAMP
+        )
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_index_ingest_queue_pending
+        ON index_ingest_queue (id) WHERE processed_at IS NULL
+        ''')
+        _init_feedback_rollup(cursor)
+        _init_change_notifications(cursor)
+
+    # Polled for rather than waited on in a transaction: CREATE INDEX CONCURRENTLY waits for every
+    # open transaction, so a process waiting for the lock in one would deadlock with the holder
+    with advisory_lock(INIT_DB_LOCK_KEY, wait=True):
+        execute_db_operation(_init)
+        _init_hot_path_indexes()
+
+# Indexes for the hot access paths: a conversation's turns in order, the newest
+# conversations first, and the feedback subsets the analysis queries scan
+HOT_PATH_INDEXES = [
+    ("idx_interactions_conversation_timestamp", "ON interactions (conversation_id, timestamp, id)"),
+    ("idx_interactions_positive", "ON interactions (timestamp DESC) WHERE user_feedback = 1"),
+    ("idx_interactions_negative", "ON interactions (timestamp DESC) WHERE user_feedback = 0"),
+    ("idx_interactions_feedback", "ON interactions (user_feedback) WHERE user_feedback IS NOT NULL"),
+    ("idx_conversations_created_at", "ON conversations (created_at DESC, id DESC)"),
+]
+
+def _init_hot_path_indexes():
+    """Build the hot-path indexes without blocking writes to existing tables.
+
+    CREATE INDEX CONCURRENTLY cannot run inside a transaction, so this runs in autocommit after
+    init_db's transaction. An index left invalid by an interrupted build is dropped and rebuilt.
+    """
+    with connection_pool.connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for name, definition in HOT_PATH_INDEXES:
+                    cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+                    row = cur.fetchone()
+                    if row and row[0]:
+                        continue
+                    if row:
+                        logger.warning(f"Rebuilding invalid index {name}.")
+                        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                    cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+        finally:
+            conn.autocommit = False
+
+def _init_feedback_rollup(cursor):
+    """Per-day and running feedback counts, kept current by a trigger on interactions.
+
+    Every write path (new turns, feedback, improvements resetting feedback, deletes) updates
+    the rollup in its own transaction, so the statistics never need to scan interactions.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS feedback_rollup_daily (
+        day DATE PRIMARY KEY,
+        interactions BIGINT NOT NULL DEFAULT 0,
+        helpful BIGINT NOT NULL DEFAULT 0,
+        not_helpful BIGINT NOT NULL DEFAULT 0
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS feedback_rollup_totals (
+        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+        interactions BIGINT NOT NULL DEFAULT 0,
+        helpful BIGINT NOT NULL DEFAULT 0,
+        not_helpful BIGINT NOT NULL DEFAULT 0
+    )
+    ''')
+    cursor.execute('''
+    CREATE OR REPLACE FUNCTION feedback_rollup_add(d DATE, n BIGINT, h BIGINT, nh BIGINT) RETURNS void AS $$
+    BEGIN
+        INSERT INTO feedback_rollup_daily AS r (day, interactions, helpful, not_helpful)
+        VALUES (d, n, h, nh)
+        ON CONFLICT (day) DO UPDATE SET interactions = r.interactions + n,
+            helpful = r.helpful + h, not_helpful = r.not_helpful + nh;
+        INSERT INTO feedback_rollup_totals AS r (id, interactions, helpful, not_helpful)
+        VALUES (TRUE, n, h, nh)
+        ON CONFLICT (id) DO UPDATE SET interactions = r.interactions + n,
+            helpful = r.helpful + h, not_helpful = r.not_helpful + nh;
+    END;
+    $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute('''
+    CREATE OR REPLACE FUNCTION feedback_rollup_apply() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM feedback_rollup_add(OLD.timestamp::date, -1,
+                -COALESCE(OLD.user_feedback = 1, FALSE)::int, -COALESCE(OLD.user_feedback = 0, FALSE)::int);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM feedback_rollup_add(NEW.timestamp::date, 1,
+                COALESCE(NEW.user_feedback = 1, FALSE)::int, COALESCE(NEW.user_feedback = 0, FALSE)::int);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    ''')
+    # Recreated on every start so changes to its definition are picked up
+    cursor.execute("DROP TRIGGER IF EXISTS interactions_feedback_rollup ON interactions")
+    cursor.execute('''
+    CREATE TRIGGER interactions_feedback_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF user_feedback, timestamp ON interactions
+    FOR EACH ROW EXECUTE FUNCTION feedback_rollup_apply()
+    ''')
+
+    # First run: backfill from the existing rows. CREATE TRIGGER above locks interactions
+    # against writes until commit, so no row is counted twice or missed.
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM feedback_rollup_totals)")
+    if not cursor.fetchone()[0]:
+        cursor.execute('''
+        INSERT INTO feedback_rollup_daily (day, interactions, helpful, not_helpful)
+        SELECT timestamp::date, COUNT(*),
+            COUNT(*) FILTER (WHERE user_feedback = 1), COUNT(*) FILTER (WHERE user_feedback = 0)
+        FROM interactions GROUP BY 1
+        ''')
+        cursor.execute('''
+        INSERT INTO feedback_rollup_totals (id, interactions, helpful, not_helpful)
+        SELECT TRUE, COALESCE(SUM(interactions), 0), COALESCE(SUM(helpful), 0), COALESCE(SUM(not_helpful), 0)
+        FROM feedback_rollup_daily
+        ''')
 
-    execute_db_operation(_init)
+def _init_change_notifications(cursor):
+    """Triggers that tell every process about writes, whichever process made them.
+
+    Changes to interactions go out on INVALIDATE_CHANNEL so other API workers can drop cached
+    history, answers and examples; new rows in the ingest queue wake the index builder. A
+    standalone process has no other workers to tell, so it leaves out the interactions trigger.
+    """
+    cursor.execute(f'''
+    CREATE OR REPLACE FUNCTION interactions_notify_change() RETURNS trigger AS $$
+    DECLARE
+        changed interactions%ROWTYPE;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN changed := OLD; ELSE changed := NEW; END IF;
+        PERFORM pg_notify('{INVALIDATE_CHANNEL}', json_build_object(
+            'origin', current_setting('application_name'),
+            'op', TG_OP,
+            'conversation_id', changed.conversation_id,
+            'interaction_id', changed.id,
+            'feedback', changed.user_feedback,
+            'answer_changed', TG_OP = 'UPDATE' AND NEW.answer IS DISTINCT FROM OLD.answer
+        )::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute(f'''
+    CREATE OR REPLACE FUNCTION index_ingest_queue_notify() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{INGEST_CHANNEL}', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute("DROP TRIGGER IF EXISTS interactions_notify_change ON interactions")
+    if INDEX_ROLE != "standalone":
+        cursor.execute('''
+        CREATE TRIGGER interactions_notify_change
+        AFTER INSERT OR DELETE OR UPDATE OF user_feedback, answer ON interactions
+        FOR EACH ROW EXECUTE FUNCTION interactions_notify_change()
+        ''')
+    cursor.execute("DROP TRIGGER IF EXISTS index_ingest_queue_notify ON index_ingest_queue")
+    cursor.execute('''
+    CREATE TRIGGER index_ingest_queue_notify
+    AFTER INSERT ON index_ingest_queue
+    FOR EACH STATEMENT EXECUTE FUNCTION index_ingest_queue_notify()
+    ''')
+
+def notify(channel, payload=""):
+    def _notify(cursor):
+        cursor.execute("SELECT pg_notify(%s, %s)", (channel, payload))
+    
+    execute_db_operation(_notify)
+
+def get_interaction(interaction_id):
+    """(conversation_id, question, answer, user_feedback) of an interaction, or None."""
+    def _get(cursor):
+        cursor.execute('''
+        SELECT conversation_id, question, answer, user_feedback FROM interactions WHERE id = %s
+        ''', (interaction_id,))
+        return cursor.fetchone()
+    
+    return execute_db_operation(_get)
 
 def store_interaction(conversation_id, question, answer, format):
     def _store(cursor):
         cursor.execute('''
         INSERT INTO interactions (conversation_id, question, answer, format)
-        VALUES (%s, %s, %s, %s) RETURNING id
+        VALUES (%s, %s, %s, %s) RETURNING id, timestamp
         ''', (conversation_id, question, answer, format))
-        interaction_id = cursor.fetchone()[0]
-        return interaction_id
+        return cursor.fetchone()
     
-    return execute_db_operation(_store)
+    interaction_id, timestamp = execute_db_operation(_store)
+    history_cache.append(conversation_id, (question, answer, timestamp))
+    return interaction_id
 
 def update_feedback(interaction_id, is_helpful):
+    """Record feedback; returns the interaction's (conversation_id, question, answer), or None if it does not exist."""
     def _update(cursor):
         feedback_value = 1 if is_helpful else 0
         cursor.execute('''
         UPDATE interactions 
         SET user_feedback = %s
         WHERE id = %s
+        RETURNING conversation_id, question, answer
         ''', (feedback_value, interaction_id))
+        return cursor.fetchone()
     
-    execute_db_operation(_update)
+    return execute_db_operation(_update)
 
-def get_feedback_statistics():
+def get_feedback_totals():
+    """Running (interactions, helpful, not_helpful) counts from the rollup."""
     def _get(cursor):
         cursor.execute('''
-        SELECT 
-            AVG(CASE WHEN user_feedback = 1 THEN 1 ELSE 0 END) as helpful_ratio,
-            AVG(CASE WHEN user_feedback = 0 THEN 1 ELSE 0 END) as not_helpful_ratio,
-            AVG(user_feedback) as average_feedback
-        FROM interactions 
-        WHERE user_feedback IS NOT NULL
+        SELECT interactions, helpful, not_helpful FROM feedback_rollup_totals
         ''')
-        return cursor.fetchone()
+        return cursor.fetchone() or (0, 0, 0)
+    
+    return execute_db_operation(_get)
+
+def get_feedback_statistics():
+    """(helpful_ratio, not_helpful_ratio, average_feedback) over rated interactions, or None if none are rated."""
+    _, helpful, not_helpful = get_feedback_totals()
+    rated = helpful + not_helpful
+    if not rated:
+        return None
+    # Feedback is 1 (helpful) or 0, so the average equals the helpful ratio
+    return helpful / rated, not_helpful / rated, helpful / rated
+
+def get_daily_feedback_statistics(days=30):
+    """(day, interactions, helpful, not_helpful) rows for the last `days` days with activity, newest first."""
+    def _get(cursor):
+        cursor.execute('''
+        SELECT day, interactions, helpful, not_helpful FROM feedback_rollup_daily
+        ORDER BY day DESC
+        LIMIT %s
+        ''', (days,))
+        return cursor.fetchall()
     
     return execute_db_operation(_get)
 
@@ -120,9 +385,125 @@ def update_interaction_for_improvement(interaction_id, improved_answer):
         UPDATE interactions 
         SET answer = %s, user_feedback = NULL 
         WHERE id = %s
+        RETURNING conversation_id
         ''', (improved_answer, interaction_id))
+        return cursor.fetchone()
     
-    execute_db_operation(_update)
+    row = execute_db_operation(_update)
+    if row:
+        history_cache.invalidate(row[0])
+
+def enqueue_improvement_jobs(limit=100):
+    """Queue the most recent low-rated interactions; returns how many jobs were added or reopened.
+
+    A finished job is reopened when its interaction is rated down again. Jobs that already
+    failed for good are left alone.
+    """
+    def _enqueue(cursor):
+        cursor.execute('''
+        INSERT INTO improvement_jobs (interaction_id)
+        SELECT id FROM interactions
+        WHERE user_feedback = 0
+        ORDER BY timestamp DESC
+        LIMIT %s
+        ON CONFLICT (interaction_id) DO UPDATE
+        SET status = 'pending', attempts = 0, claimed_by = NULL, leased_until = NULL,
+            available_at = CURRENT_TIMESTAMP, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE improvement_jobs.status = 'done'
+        ''', (limit,))
+        return cursor.rowcount
+    
+    return execute_db_operation(_enqueue)
+
+def claim_improvement_jobs(worker_id, limit, lease_seconds):
+    """Lease up to `limit` due jobs to this worker; returns (interaction_id, question, answer) rows.
+
+    SKIP LOCKED lets several replicas claim concurrently without taking the same job, and
+    jobs whose lease expired (a worker died mid-job) become claimable again.
+    """
+    def _claim(cursor):
+        cursor.execute('''
+        WITH due AS (
+            SELECT interaction_id FROM improvement_jobs
+            WHERE available_at <= CURRENT_TIMESTAMP
+              AND (status = 'pending' OR (status = 'running' AND leased_until < CURRENT_TIMESTAMP))
+            ORDER BY available_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE improvement_jobs j
+        SET status = 'running', claimed_by = %s, attempts = j.attempts + 1,
+            leased_until = CURRENT_TIMESTAMP + make_interval(secs => %s), updated_at = CURRENT_TIMESTAMP
+        FROM due, interactions i
+        WHERE j.interaction_id = due.interaction_id AND i.id = j.interaction_id
+        RETURNING j.interaction_id, i.question, i.answer
+        ''', (limit, worker_id, lease_seconds))
+        return cursor.fetchall()
+    
+    return execute_db_operation(_claim)
+
+def complete_improvement_job(worker_id, interaction_id, improved_answer):
+    """Store the improved answer if this worker still holds the job; returns whether it did.
+
+    The interaction's index document, which ends with the answer, is queued again with the
+    improved answer so the ingest loop replaces the old one.
+    """
+    def _complete(cursor):
+        cursor.execute('''
+        WITH job AS (
+            UPDATE improvement_jobs
+            SET status = 'done', leased_until = NULL, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE interaction_id = %s AND claimed_by = %s AND status = 'running'
+            RETURNING interaction_id
+        ), old AS (
+            SELECT id, answer FROM interactions WHERE id = %s
+        ), improved AS (
+            UPDATE interactions i
+            SET answer = %s, user_feedback = NULL
+            FROM job
+            WHERE i.id = job.interaction_id
+            RETURNING i.id, i.conversation_id
+        ), requeued AS (
+            INSERT INTO index_ingest_queue (interaction_id, conversation_id, content)
+            SELECT q.interaction_id, q.conversation_id, left(q.content, length(q.content) - length(old.answer)) || %s
+            FROM improved
+            JOIN old ON old.id = improved.id
+            JOIN LATERAL (
+                SELECT interaction_id, conversation_id, content FROM index_ingest_queue
+                WHERE interaction_id = improved.id ORDER BY id DESC LIMIT 1
+            ) q ON TRUE
+            WHERE right(q.content, length(old.answer)) = old.answer
+        )
+        SELECT conversation_id FROM improved
+        ''', (interaction_id, worker_id, interaction_id, improved_answer, improved_answer))
+        return cursor.fetchone()
+    
+    row = execute_db_operation(_complete)
+    if row:
+        history_cache.invalidate(row[0])
+    return row is not None
+
+def fail_improvement_job(worker_id, interaction_id, error, retry_after, max_attempts):
+    """Release a job for a later retry, or mark it failed once it has used `max_attempts`."""
+    def _fail(cursor):
+        cursor.execute('''
+        UPDATE improvement_jobs
+        SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+            claimed_by = NULL, leased_until = NULL, last_error = %s,
+            available_at = CURRENT_TIMESTAMP + make_interval(secs => %s), updated_at = CURRENT_TIMESTAMP
+        WHERE interaction_id = %s AND claimed_by = %s
+        ''', (max_attempts, error, retry_after, interaction_id, worker_id))
+    
+    execute_db_operation(_fail)
+
+def get_improvement_job_counts():
+    def _get(cursor):
+        cursor.execute('''
+        SELECT status, COUNT(*) FROM improvement_jobs GROUP BY status
+        ''')
+        return dict(cursor.fetchall())
+    
+    return execute_db_operation(_get)
 
 def get_conversation(conversation_id):
     def _get(cursor):
@@ -145,6 +526,29 @@ def get_conversation_history(conversation_id):
     
     return execute_db_operation(_get)
 
+def get_recent_history(conversation_id):
+    """The last HISTORY_WINDOW turns of a conversation, served from the history cache when possible."""
+    cached = history_cache.get(conversation_id)
+    if cached is not None:
+        return cached
+
+    def _get(cursor):
+        cursor.execute('''
+        SELECT question, answer, timestamp FROM (
+            SELECT question, answer, timestamp
+            FROM interactions
+            WHERE conversation_id = %s
+            ORDER BY timestamp DESC, id DESC
+            LIMIT %s
+        ) recent
+        ORDER BY timestamp ASC
+        ''', (conversation_id, HISTORY_WINDOW))
+        return cursor.fetchall()
+    
+    history = execute_db_operation(_get)
+    history_cache.put(conversation_id, history)
+    return history
+
 def get_all_conversations():
     def _get(cursor):
         cursor.execute('''
@@ -154,6 +558,72 @@ def get_all_conversations():
     
     return execute_db_operation(_get)
 
+def encode_cursor(timestamp, row_id):
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor."""
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), row_id
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def get_conversations_page(limit, cursor=None):
+    """Newest conversations first, continuing after `cursor`; returns (rows, next_cursor)."""
+    def _get(db_cursor):
+        if cursor is None:
+            db_cursor.execute('''
+            SELECT id, title, created_at FROM conversations
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+            ''', (limit + 1,))
+        else:
+            created_at, conversation_id = decode_cursor(cursor)
+            db_cursor.execute('''
+            SELECT id, title, created_at FROM conversations
+            WHERE (created_at, id) < (%s, %s)
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+            ''', (created_at, conversation_id, limit + 1))
+        return db_cursor.fetchall()
+
+    rows = execute_db_operation(_get)
+    # One extra row tells whether another page exists without a COUNT
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][2], rows[-1][0])
+    return [(id, title) for id, title, _ in rows], next_cursor
+
+def get_conversation_history_page(conversation_id, limit, cursor=None):
+    """A conversation's turns oldest first, continuing after `cursor`; returns (rows, next_cursor)."""
+    def _get(db_cursor):
+        if cursor is None:
+            db_cursor.execute('''
+            SELECT id, question, answer, timestamp FROM interactions
+            WHERE conversation_id = %s
+            ORDER BY timestamp ASC, id ASC
+            LIMIT %s
+            ''', (conversation_id, limit + 1))
+        else:
+            timestamp, interaction_id = decode_cursor(cursor)
+            db_cursor.execute('''
+            SELECT id, question, answer, timestamp FROM interactions
+            WHERE conversation_id = %s AND (timestamp, id) > (%s, %s)
+            ORDER BY timestamp ASC, id ASC
+            LIMIT %s
+            ''', (conversation_id, timestamp, interaction_id, limit + 1))
+        return db_cursor.fetchall()
+
+    rows = execute_db_operation(_get)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][3], rows[-1][0])
+    return rows, next_cursor
+
 def create_new_conversation(conversation_id: str, title: str):
     def _create(cursor):
         cursor.execute('''
@@ -170,10 +640,11 @@ def update_conversation_title(conversation_id, title):
     
     execute_db_operation(_update)
 
-def get_recent_positive_interactions(limit=10):
+def get_helpful_interactions(limit=1000):
+    """The most recent interactions rated helpful, as (id, conversation_id, question, answer), newest first."""
     def _get(cursor):
         cursor.execute('''
-        SELECT question, answer 
+        SELECT id, conversation_id, question, answer
         FROM interactions 
         WHERE user_feedback = 1
         ORDER BY timestamp DESC
@@ -183,24 +654,164 @@ def get_recent_positive_interactions(limit=10):
     
     return execute_db_operation(_get)
 
-def get_interaction_count():
+def begin_turn(conversation_id, title):
+    """Everything /ask needs from the database before generating, in one statement.
+
+    Creates the conversation if it does not exist yet and returns its last HISTORY_WINDOW turns,
+    oldest first. The history is only read from the database when the history cache does not
+    already hold it.
+    """
+    cached_history = history_cache.get(conversation_id)
+
+    def _begin(cursor):
+        cursor.execute('''
+        WITH upsert AS (
+            INSERT INTO conversations (id, title) VALUES (%s, %s)
+            ON CONFLICT (id) DO NOTHING
+        )
+        SELECT question, answer, timestamp FROM (
+            SELECT question, answer, timestamp
+            FROM interactions
+            WHERE conversation_id = %s AND %s
+            ORDER BY timestamp DESC, id DESC
+            LIMIT %s
+        ) recent
+        ORDER BY timestamp ASC
+        ''', (conversation_id, title, conversation_id, cached_history is None, HISTORY_WINDOW))
+        return cursor.fetchall()
+    
+    history = execute_db_operation(_begin)
+    if cached_history is None:
+        history_cache.put(conversation_id, history)
+    else:
+        history = cached_history
+    return history
+
+def finish_turn(conversation_id, question, answer, format, title, index_content=None):
+    """Store the interaction and update the conversation title in one statement.
+
+    With `index_content`, the interaction's index document is queued for ingestion in the
+    same transaction, so it cannot be lost between the answer being saved and indexed.
+    """
+    def _finish(cursor):
+        cursor.execute('''
+        WITH new_interaction AS (
+            INSERT INTO interactions (conversation_id, question, answer, format)
+            VALUES (%s, %s, %s, %s) RETURNING id, timestamp
+        ), title_update AS (
+            UPDATE conversations SET title = %s WHERE id = %s
+        ), queued AS (
+            INSERT INTO index_ingest_queue (interaction_id, conversation_id, content)
+            SELECT id, %s, %s FROM new_interaction WHERE %s
+        )
+        SELECT id, timestamp FROM new_interaction
+        ''', (conversation_id, question, answer, format, title, conversation_id,
+              conversation_id, index_content, index_content is not None))
+        return cursor.fetchone()
+    
+    interaction_id, timestamp = execute_db_operation(_finish)
+    history_cache.append(conversation_id, (question, answer, timestamp))
+    return interaction_id
+
+def get_pending_index_documents(after_id, limit):
+    """Unprocessed (id, interaction_id, conversation_id, content) queue rows after `after_id`, oldest first."""
     def _get(cursor):
-        cursor.execute("SELECT COUNT(*) FROM interactions")
-        return cursor.fetchone()[0]
+        cursor.execute('''
+        SELECT id, interaction_id, conversation_id, content FROM index_ingest_queue
+        WHERE processed_at IS NULL AND id > %s
+        ORDER BY id
+        LIMIT %s
+        ''', (after_id, limit))
+        return cursor.fetchall()
     
     return execute_db_operation(_get)
 
+def mark_index_documents_processed(queue_ids):
+    def _mark(cursor):
+        cursor.execute('''
+        UPDATE index_ingest_queue SET processed_at = CURRENT_TIMESTAMP WHERE id = ANY(%s)
+        ''', (list(queue_ids),))
+    
+    execute_db_operation(_mark)
+
+def requeue_index_documents(limit):
+    """Mark the latest `limit` queued documents unprocessed, to rebuild the interaction segment from them."""
+    def _requeue(cursor):
+        cursor.execute('''
+        UPDATE index_ingest_queue SET processed_at = NULL
+        WHERE id IN (SELECT id FROM index_ingest_queue ORDER BY id DESC LIMIT %s)
+        ''', (limit,))
+        return cursor.rowcount
+    
+    return execute_db_operation(_requeue)
+
+def get_interaction_states(interaction_ids, max_age_days):
+    """{interaction_id: (user_feedback, older than max_age_days)} for the given ids that still exist."""
+    def _get(cursor):
+        # Compared in the database, which wrote the timestamps in its own time zone
+        cursor.execute('''
+        SELECT id, user_feedback, timestamp < now() - make_interval(days => %s)
+        FROM interactions WHERE id = ANY(%s)
+        ''', (max_age_days, list(interaction_ids)))
+        return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+    
+    return execute_db_operation(_get)
+
+@contextmanager
+def advisory_lock(key, wait=False, poll_interval=0.2):
+    """Try to take a cluster-wide session lock; yields whether it was acquired.
+
+    With `wait`, tries every `poll_interval` seconds until it is acquired, with no transaction
+    open in between. The pooled connection holding the lock is kept for the duration of the block.
+    """
+    with connection_pool.connection() as conn:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+                acquired = cur.fetchone()[0]
+            conn.commit()
+            if acquired or not wait:
+                break
+            time.sleep(poll_interval)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (key,))
+                conn.commit()
+
+def get_interaction_count():
+    return get_feedback_totals()[0]
+
 def get_average_feedback():
+    _, helpful, not_helpful = get_feedback_totals()
+    rated = helpful + not_helpful
+    return helpful / rated if rated else None
+
+def get_cached_embeddings(keys):
     def _get(cursor):
         cursor.execute('''
-        SELECT AVG(user_feedback) FROM interactions WHERE user_feedback IS NOT NULL
-        ''')
-        return cursor.fetchone()[0]
+        SELECT key, embedding FROM embedding_cache WHERE key = ANY(%s)
+        ''', (list(keys),))
+        return dict(cursor.fetchall())
     
     return execute_db_operation(_get)
 
+def store_cached_embeddings(model, items):
+    def _store(cursor):
+        execute_values(cursor, '''
+        INSERT INTO embedding_cache (key, model, embedding) VALUES %s
+        ON CONFLICT (key) DO NOTHING
+        ''', [(key, model, embedding) for key, embedding in items])
+    
+    execute_db_operation(_store)
+
 def delete_conversation(conversation_id):
     def _delete(cursor):
+        cursor.execute('''
+        DELETE FROM chat_history WHERE session_id = %s
+        ''', (conversation_id,))
         cursor.execute('''
         DELETE FROM interactions WHERE conversation_id = %s
         ''', (conversation_id,))
@@ -208,4 +819,6 @@ def delete_conversation(conversation_id):
         DELETE FROM conversations WHERE id = %s
         ''', (conversation_id,))
     
-    return execute_db_operation(_delete)
+    result = execute_db_operation(_delete)
+    history_cache.invalidate(conversation_id)
+    return result
@@ -0,0 +1,236 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import PoolError
+
+from config import DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_PRE_PING_AFTER, DB_POOL_MAX_LIFETIME
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool shared by every module that talks to Postgres.
+
+    Unlike psycopg2's pools, checkout blocks (up to `timeout` seconds) when all connections are
+    in use. Connections that sat idle for longer than `pre_ping_after` seconds are checked with
+    a ping before being handed out, and connections older than `max_lifetime` are replaced.
+    `session_setup` statements run once per new connection instead of on every checkout.
+    No connection is opened until the first checkout or `fill()`, so creating the pool is free.
+    """
+
+    def __init__(self, dsn, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 pre_ping_after=DB_POOL_PRE_PING_AFTER, max_lifetime=DB_POOL_MAX_LIFETIME, session_setup=()):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.pre_ping_after = pre_ping_after
+        self.max_lifetime = max_lifetime
+        self.session_setup = list(session_setup)
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, created_at, returned_at)
+        self._created_at = {}
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+
+        self.checkouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+        self.recycled = 0
+
+    def fill(self):
+        """Open connections until `minconn` exist, e.g. while the app warms up."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.minconn:
+                    return
+                self._size += 1
+            conn = self._connect()
+            with self._cond:
+                self._idle.append((conn, self._created_at[id(conn)], time.monotonic()))
+                self._cond.notify()
+
+    def _connect(self):
+        try:
+            conn = psycopg2.connect(self.dsn)
+            if self.session_setup:
+                with conn.cursor() as cur:
+                    for statement in self.session_setup:
+                        cur.execute(statement)
+                conn.commit()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _close(self, conn):
+        # Closes the connection but keeps its slot, e.g. for a replacement
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _discard(self, conn):
+        self._close(conn)
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _is_usable(self, conn, created_at, returned_at):
+        now = time.monotonic()
+        if conn.closed or now - created_at > self.max_lifetime:
+            return False
+        if now - returned_at > self.pre_ping_after:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise PoolError("connection pool is closed")
+                    if self._idle:
+                        candidate = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        candidate = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f"timed out after {self.timeout}s waiting for a database connection")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+        if candidate is None:
+            conn = self._connect()
+        else:
+            conn, created_at, returned_at = candidate
+            if not self._is_usable(conn, created_at, returned_at):
+                self.recycled += 1
+                self._close(conn)
+                conn = self._connect()
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+        return conn
+
+    def putconn(self, conn, close=False):
+        created_at = self._created_at.get(id(conn))
+        broken = conn.closed or created_at is None
+        if not broken and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if close or broken or self._closed or time.monotonic() - created_at > self.max_lifetime:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            # Most likely a dropped connection; never hand it out again
+            self.putconn(conn, close=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            in_use = self._size - len(self._idle)
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "waiting": self._waiting,
+                "max_size": self.maxconn,
+                "saturation": in_use / self.maxconn if self.maxconn else 0.0,
+                "checkouts": self.checkouts,
+                "wait_time_total": self.wait_time_total,
+                "wait_time_max": self.wait_time_max,
+                "wait_time_avg": self.wait_time_total / self.checkouts if self.checkouts else 0.0,
+                "timeouts": self.timeouts,
+                "recycled": self.recycled,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# psycopg2 has no asyncio support, so async callers run blocking DB work on this executor.
+# It has one thread per pooled connection, so queued calls wait here rather than in the pool.
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX, thread_name_prefix="db")
+
+
+def configure_pool(dsn, **kwargs):
+    """Create the shared pool; later calls return the existing one."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(dsn, **kwargs)
+            logger.info(f"Created database connection pool ({_pool.minconn}-{_pool.maxconn} connections).")
+        return _pool
+
+
+def get_pool():
+    if _pool is None:
+        raise RuntimeError("Database connection pool has not been configured.")
+    return _pool
+
+
+async def run_db(func, *args, **kwargs):
+    # Run in a copy of the caller's context so log lines keep the request and span ids
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, functools.partial(context.run, func, *args, **kwargs))
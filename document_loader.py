@@ -1,44 +1,136 @@
 from langchain.schema import Document
-from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import multiprocessing
+import hashlib
 import os
 import logging
+from pypdf import PdfReader
+from context_builder import add_token_counts
+from config import CHUNK_SIZE, CHUNK_OVERLAP, UPLOAD_DIR, INGEST_WORKERS, INGEST_PAGES_PER_TASK
 
 logger = logging.getLogger(__name__)
 
-def load_documents():
-    # current directory
-    current_dir = os.path.dirname(os.path.abspath(__file__))
+FALLBACK_CHUNK_ID = "fallback"
 
-    pdf_paths = [
-                'upload/DMUDATASET.pdf']
+def scan_upload_dir(upload_dir=UPLOAD_DIR):
+    pdf_paths = []
+    for root, _, files in os.walk(upload_dir):
+        for name in files:
+            if name.lower().endswith(".pdf"):
+                pdf_paths.append(os.path.join(root, name))
+    return sorted(pdf_paths)
+
+def file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def assign_chunk_ids(chunks, seen=None):
+    # Ids are derived from the source and the chunk text, so an unchanged chunk keeps its id
+    # across re-ingestion; repeated identical chunks in one file are told apart by occurrence.
+    # Pass the same `seen` counter for every batch of chunks that belongs to one file.
+    if seen is None:
+        seen = Counter()
+    for chunk in chunks:
+        source = chunk.metadata.get("source", "")
+        digest = hashlib.sha256(f"{source}\0{chunk.page_content}".encode("utf-8")).hexdigest()
+        seen[digest] += 1
+        chunk.metadata["chunk_id"] = digest if seen[digest] == 1 else f"{digest}-{seen[digest] - 1}"
+    return chunks
+
+def get_text_splitter():
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+# Per-worker-process reader for the file currently being parsed, so each worker opens it once
+_worker_reader = {}
+
+def get_worker_reader(pdf_path):
+    key = (pdf_path, os.path.getmtime(pdf_path))
+    if key not in _worker_reader:
+        _worker_reader.clear()
+        _worker_reader[key] = PdfReader(pdf_path)
+    return _worker_reader[key]
+
+def parse_page_range(pdf_path, start, stop):
+    # Runs in a worker process: extract and split one range of pages, mirroring PyPDFLoader's metadata
+    reader = get_worker_reader(pdf_path)
+    pages = [
+        Document(page_content=reader.pages[i].extract_text(), metadata={"source": pdf_path, "page": i})
+        for i in range(start, stop)
+    ]
+    return add_token_counts(get_text_splitter().split_documents(pages))
+
+def create_parse_executor(max_workers=INGEST_WORKERS):
+    # Spawned workers avoid forking a process that already holds DB connections and threads
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+def iter_file_chunks(pdf_path, executor):
+    """Yield the chunks of one PDF in page order while later page ranges are parsed in parallel.
+
+    At most two tasks per worker are in flight, so memory stays bounded for very large files.
+    """
+    logger.info(f"Loading PDF: {pdf_path}")
+    page_count = len(PdfReader(pdf_path).pages)
+    ranges = iter(range(0, page_count, INGEST_PAGES_PER_TASK))
+    max_in_flight = executor._max_workers * 2
+    pending = deque()
+    seen = Counter()
+
+    for start in islice(ranges, max_in_flight):
+        pending.append(executor.submit(parse_page_range, pdf_path, start, min(start + INGEST_PAGES_PER_TASK, page_count)))
+    while pending:
+        chunks = pending.popleft().result()
+        start = next(ranges, None)
+        if start is not None:
+            pending.append(executor.submit(parse_page_range, pdf_path, start, min(start + INGEST_PAGES_PER_TASK, page_count)))
+        yield from assign_chunk_ids(chunks, seen)
+
+def iter_document_chunks(pdf_paths=None, executor=None):
+    if pdf_paths is None:
+        pdf_paths = scan_upload_dir()
+    if executor is None:
+        with create_parse_executor() as executor:
+            yield from iter_document_chunks(pdf_paths, executor)
+        return
 
-    # Load PDFs 
-    all_data = []
     for pdf_path in pdf_paths:
-        if os.path.exists(pdf_path):
-            logger.info(f"Loading PDF: {pdf_path}")
-            try:
-                loader = PyPDFLoader(pdf_path)
-                all_data.extend(loader.load())
-            except Exception as e:
-                logger.error(f"Error loading {pdf_path}: {str(e)}")
-        else:
+        if not os.path.exists(pdf_path):
             logger.warning(f"Warning: PDF file not found: {pdf_path}")
+            continue
+        try:
+            yield from iter_file_chunks(pdf_path, executor)
+        except Exception as e:
+            logger.error(f"Error loading {pdf_path}: {str(e)}")
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def fallback_documents():
+    fallback_text = "This is a fallback document. No PDFs were successfully loaded."
+    return add_token_counts([Document(page_content=fallback_text, metadata={"source": "fallback", "chunk_id": FALLBACK_CHUNK_ID})])
+
+def load_documents(pdf_paths=None):
+    if pdf_paths is None:
+        pdf_paths = scan_upload_dir()
+
+    # Load and split PDFs
+    docs = list(iter_document_chunks(pdf_paths))
     
-    if not all_data:
+    if not docs:
         logger.warning("No PDF documents were loaded. Please check your PDF file locations.")
         
         # Fallback to a simple text document
-        fallback_text = "This is a fallback document. No PDFs were successfully loaded."
-        all_data = [Document(page_content=fallback_text, metadata={"source": "fallback"})]
-
-    # Split text
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=200)
-    docs = text_splitter.split_documents(all_data)
+        docs = fallback_documents()
 
     logger.info(f"Loaded {len(docs)} document chunks.")
     return docs
 
 # Uncomment the following line if you want to test the function directly
-# load_documents()
\ No newline at end of file
+# load_documents()
@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+from config import EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PERSIST
+from database_manager import get_cached_embeddings, store_cached_embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with an in-memory LRU tier backed by the embedding_cache table.
+
+    Entries are keyed by the embedding model and a hash of the normalized text, so
+    identical chunks and repeated questions are only ever embedded once. Only corpus chunks
+    are persisted: search queries, which include the conversation history, and interaction
+    documents rarely repeat, so they stay in the in-memory tier rather than cost two round
+    trips each and grow the table.
+    """
+
+    def __init__(self, underlying, model, max_entries=EMBEDDING_CACHE_SIZE, persist=EMBEDDING_CACHE_PERSIST):
+        self.underlying = underlying
+        self.model = model
+        self.max_entries = max_entries
+        self.persist = persist
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def cache_key(self, text):
+        return hashlib.sha256(f"{self.model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _memory_get(self, key):
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+            return embedding
+
+    def _memory_put(self, key, embedding):
+        with self._lock:
+            self._memory[key] = embedding
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _persistent_get(self, keys, persist):
+        if not persist or not keys:
+            return {}
+        try:
+            return get_cached_embeddings(keys)
+        except Exception as e:
+            logger.warning(f"Embedding cache lookup failed, embedding without it: {e}")
+            return {}
+
+    def _persistent_put(self, items, persist):
+        if not persist or not items:
+            return
+        try:
+            store_cached_embeddings(self.model, items)
+        except Exception as e:
+            logger.warning(f"Could not persist embeddings to cache: {e}")
+
+    def embed_documents(self, texts, persist=True):
+        return self._embed(texts, persist and self.persist)
+
+    def _embed(self, texts, persist):
+        keys = [self.cache_key(text) for text in texts]
+        found = {}
+
+        for key in set(keys):
+            embedding = self._memory_get(key)
+            if embedding is not None:
+                found[key] = embedding
+        memory_hits = len(found)
+
+        stored = self._persistent_get([key for key in set(keys) if key not in found], persist)
+        for key, embedding in stored.items():
+            found[key] = embedding
+            self._memory_put(key, embedding)
+
+        # Embed each distinct missing text once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            new_embeddings = self.underlying.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), new_embeddings))
+            for key, embedding in new_items:
+                found[key] = embedding
+                self._memory_put(key, embedding)
+            self._persistent_put(new_items, persist)
+
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.persistent_hits += len(stored)
+            self.misses += len(missing)
+
+        return [list(found[key]) for key in keys]
+
+    def embed_query(self, text):
+        return self._embed([text], persist=False)[0]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.persistent_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.persistent_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,91 @@
+import logging
+import threading
+
+import numpy as np
+
+from config import EXAMPLE_COUNT, EXAMPLE_MIN_SIMILARITY, EXAMPLE_STORE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+
+class ExampleStore:
+    """Helpful past answers, selected as few-shot examples by similarity to the incoming question.
+
+    Each example's question is embedded once, when it is loaded at startup or rated helpful,
+    so selecting examples is a matrix product in memory rather than a query per request.
+    """
+
+    def __init__(self, max_entries=EXAMPLE_STORE_MAX_ENTRIES, min_similarity=EXAMPLE_MIN_SIMILARITY):
+        self.max_entries = max_entries
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self._entries = []
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self.loaded = False
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _rebuild(self, entries):
+        self._entries = entries
+        self._vectors = np.stack([entry["vector"] for entry in entries]) if entries else np.empty((0, 0), dtype=np.float32)
+
+    def load(self, rows, vectors):
+        """Replace the store with `rows` of (interaction_id, conversation_id, question, answer), newest first."""
+        entries = [
+            {"interaction_id": interaction_id, "conversation_id": conversation_id,
+             "question": question, "answer": answer, "vector": self._normalize(vector)}
+            for (interaction_id, conversation_id, question, answer), vector in zip(rows, vectors)
+        ]
+        with self._lock:
+            self._rebuild(entries[:self.max_entries][::-1])
+            self.loaded = True
+        logger.info(f"Loaded {len(self._entries)} few-shot examples.")
+
+    def add(self, interaction_id, conversation_id, question, answer, vector):
+        entry = {"interaction_id": interaction_id, "conversation_id": conversation_id,
+                 "question": question, "answer": answer, "vector": self._normalize(vector)}
+        with self._lock:
+            entries = [e for e in self._entries if e["interaction_id"] != interaction_id] + [entry]
+            self._rebuild(entries[-self.max_entries:])
+
+    def remove(self, interaction_id):
+        with self._lock:
+            if any(e["interaction_id"] == interaction_id for e in self._entries):
+                self._rebuild([e for e in self._entries if e["interaction_id"] != interaction_id])
+
+    def remove_conversation(self, conversation_id):
+        with self._lock:
+            if any(e["conversation_id"] == conversation_id for e in self._entries):
+                self._rebuild([e for e in self._entries if e["conversation_id"] != conversation_id])
+
+    def select(self, question_vector, k=EXAMPLE_COUNT, exclude_conversation=None):
+        """Up to `k` (question, answer) pairs at least `min_similarity` similar to the question, best first.
+
+        Examples from `exclude_conversation` are skipped; the model already sees them as history.
+        """
+        if question_vector is None or not k:
+            return []
+        vector = self._normalize(question_vector)
+        with self._lock:
+            entries, vectors = self._entries, self._vectors
+        if not entries or vectors.shape[1] != vector.shape[0]:
+            return []
+        scores = vectors @ vector
+        selected = []
+        for i in np.argsort(-scores):
+            if scores[i] < self.min_similarity or len(selected) == k:
+                break
+            if entries[i]["conversation_id"] != exclude_conversation:
+                selected.append((entries[i]["question"], entries[i]["answer"]))
+        return selected
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "loaded": self.loaded}
+
+
+example_store = ExampleStore()
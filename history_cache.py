@@ -0,0 +1,82 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from config import HISTORY_WINDOW, HISTORY_CACHE_CONVERSATIONS, HISTORY_CACHE_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+def turn_size(turn):
+    question, answer, _ = turn
+    return len(question.encode("utf-8")) + len(answer.encode("utf-8")) + 64
+
+
+class ConversationHistoryCache:
+    """LRU of the most recent turns of each conversation, bounded by conversation count and bytes.
+
+    Only the last `window` (question, answer, timestamp) turns are kept, which is all any consumer
+    uses. Writers append through the cache so it never needs to re-read a conversation it holds.
+    """
+
+    def __init__(self, window=HISTORY_WINDOW, max_conversations=HISTORY_CACHE_CONVERSATIONS,
+                 max_bytes=HISTORY_CACHE_BYTES):
+        self.window = window
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self._turns = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _set(self, conversation_id, turns):
+        turns = list(turns[-self.window:]) if self.window else []
+        size = sum(turn_size(turn) for turn in turns)
+        self._bytes += size - self._sizes.get(conversation_id, 0)
+        self._turns[conversation_id] = turns
+        self._sizes[conversation_id] = size
+        self._turns.move_to_end(conversation_id)
+        while self._turns and (len(self._turns) > self.max_conversations or self._bytes > self.max_bytes):
+            evicted, _ = self._turns.popitem(last=False)
+            self._bytes -= self._sizes.pop(evicted)
+
+    def get(self, conversation_id):
+        with self._lock:
+            turns = self._turns.get(conversation_id)
+            if turns is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._turns.move_to_end(conversation_id)
+            return list(turns)
+
+    def put(self, conversation_id, turns):
+        with self._lock:
+            self._set(conversation_id, turns)
+
+    def append(self, conversation_id, turn):
+        # A conversation that is not cached is read in full the next time it is needed
+        with self._lock:
+            turns = self._turns.get(conversation_id)
+            if turns is not None:
+                self._set(conversation_id, turns + [turn])
+
+    def invalidate(self, conversation_id):
+        with self._lock:
+            if self._turns.pop(conversation_id, None) is not None:
+                self._bytes -= self._sizes.pop(conversation_id)
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"conversations": len(self._turns), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+history_cache = ConversationHistoryCache()
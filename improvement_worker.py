@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+
+from config import (IMPROVEMENT_INTERVAL, IMPROVEMENT_NEGATIVE_RATIO, IMPROVEMENT_CONCURRENCY,
+                    IMPROVEMENT_BATCH_SIZE, IMPROVEMENT_LEASE_SECONDS, IMPROVEMENT_MAX_ATTEMPTS,
+                    IMPROVEMENT_MAX_POOL_SATURATION)
+from database_manager import (get_feedback_statistics, enqueue_improvement_jobs, claim_improvement_jobs,
+                              complete_improvement_job, fail_improvement_job, get_improvement_job_counts,
+                              get_pool_stats, run_db)
+
+logger = logging.getLogger(__name__)
+
+
+class ImprovementWorker:
+    """Works through the improvement_jobs queue with a bounded number of concurrent LLM calls.
+
+    `improve` is an async function (question, previous_answer) -> improved answer. Jobs are leased
+    in batches, so several API replicas can run a worker each without improving the same answer
+    twice. Rate-limited calls back off exponentially and are retried without giving up the lease.
+    Before each call the worker waits while the DB pool is busier than `max_pool_saturation`, so
+    foreground requests keep priority.
+    """
+
+    def __init__(self, improve, concurrency=IMPROVEMENT_CONCURRENCY, batch_size=IMPROVEMENT_BATCH_SIZE,
+                 lease_seconds=IMPROVEMENT_LEASE_SECONDS, max_attempts=IMPROVEMENT_MAX_ATTEMPTS,
+                 max_pool_saturation=IMPROVEMENT_MAX_POOL_SATURATION, max_rate_limit_retries=5):
+        self.improve = improve
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.max_pool_saturation = max_pool_saturation
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+        self.in_flight = 0
+        self.claimed = 0
+        self.improved = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.last_run_started = None
+        self.last_run_finished = None
+        self.last_run_seconds = None
+
+    async def wait_for_capacity(self):
+        while get_pool_stats()["saturation"] > self.max_pool_saturation:
+            await asyncio.sleep(1)
+
+    async def call_with_backoff(self, question, answer):
+        # Imported here: openai is slow to import and only needed once there is work to do
+        from openai import RateLimitError
+
+        delay = 1.0
+        for attempt in range(self.max_rate_limit_retries + 1):
+            await self.wait_for_capacity()
+            try:
+                return await self.improve(question, answer)
+            except RateLimitError as e:
+                if attempt == self.max_rate_limit_retries:
+                    raise
+                self.rate_limited += 1
+                retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+                try:
+                    wait = float(retry_after)
+                except (TypeError, ValueError):
+                    wait = delay + random.uniform(0, delay)
+                logger.warning(f"Rate limited while improving an answer; retrying in {wait:.1f}s")
+                await asyncio.sleep(wait)
+                delay = min(delay * 2, 60)
+
+    async def process(self, interaction_id, question, answer):
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                improved_answer = await self.call_with_backoff(question, answer)
+                if await run_db(complete_improvement_job, self.worker_id, interaction_id, improved_answer):
+                    self.improved += 1
+                    logger.info(f"Improved answer for interaction {interaction_id}")
+                else:
+                    logger.info(f"Lease on interaction {interaction_id} was lost; discarding the improved answer")
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error improving interaction {interaction_id}: {str(e)}")
+                await run_db(fail_improvement_job, self.worker_id, interaction_id, str(e),
+                             self.lease_seconds, self.max_attempts)
+            finally:
+                self.in_flight -= 1
+
+    async def run_once(self):
+        """Queue the low-rated interactions if needed, then drain every due job."""
+        self.last_run_started = time.time()
+        stats = await run_db(get_feedback_statistics)
+        if stats:
+            positive_ratio, negative_ratio, avg_feedback = stats
+            logger.info(f"Feedback stats: Positive: {positive_ratio:.2f}, Negative: {negative_ratio:.2f}, Average: {avg_feedback:.2f}")
+            if negative_ratio > IMPROVEMENT_NEGATIVE_RATIO:
+                queued = await run_db(enqueue_improvement_jobs)
+                logger.info(f"Queued {queued} interactions for improvement")
+
+        while True:
+            jobs = await run_db(claim_improvement_jobs, self.worker_id, self.batch_size, self.lease_seconds)
+            if not jobs:
+                break
+            self.claimed += len(jobs)
+            await asyncio.gather(*(self.process(*job) for job in jobs))
+
+        self.last_run_finished = time.time()
+        self.last_run_seconds = self.last_run_finished - self.last_run_started
+
+    async def run_forever(self, interval=IMPROVEMENT_INTERVAL):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Error in answer improvement run: {str(e)}")
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "claimed": self.claimed,
+            "improved": self.improved,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "last_run_started": self.last_run_started,
+            "last_run_finished": self.last_run_finished,
+            "last_run_seconds": self.last_run_seconds,
+        }
+
+    async def astats(self):
+        stats = self.stats()
+        stats["jobs"] = await run_db(get_improvement_job_counts)
+        return stats
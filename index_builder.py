@@ -0,0 +1,107 @@
+"""Index builder for the multi-worker deployment.
+
+Builds and syncs the corpus index and drains the interaction ingest queue, publishing each
+result as an immutable snapshot under INDEX_DIR. API workers started with INDEX_ROLE=worker
+never build; they swap in each snapshot this process publishes:
+
+    python index_builder.py
+    INDEX_ROLE=worker uvicorn main:app --workers 4 --port 8050
+
+Run exactly one builder per INDEX_DIR. Workers must share INDEX_DIR and DATABASE_URL with it.
+To have /metrics cover every worker rather than the one a scrape reaches, also set
+PROMETHEUS_MULTIPROC_DIR for the workers to a directory that is emptied before they start.
+To serve an earlier corpus snapshot (by default the one before the live one), run
+
+    python index_builder.py --rollback [VERSION]
+
+which moves CURRENT and announces it; workers and the running builder then swap it in. The
+rolled-back index stays pinned, and is not synced with the upload directory, until
+
+    python index_builder.py --rebuild
+
+publishes a forced full rebuild.
+"""
+import argparse
+import os
+
+os.environ["INDEX_ROLE"] = "builder"
+
+import asyncio
+import logging
+import threading
+
+from config import load_environment, INDEX_SYNC_INTERVAL
+from database_manager import init_db, DATABASE_URL, SESSION_SETUP
+from index_manager import (load_or_create_index, load_interaction_segment, sync_index, request_ingest, run_ingest_loop,
+                           refresh_snapshots, rollback_index, build_new_index, current_snapshot_dir, index_write_lock)
+from notifications import NotificationListener, INGEST_CHANNEL, INDEX_CHANNEL
+from observability import configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+
+def follow_rollback():
+    # A rollback run from another process moved CURRENT; syncing from the old live store would undo it
+    with index_write_lock:
+        if refresh_snapshots():
+            logger.info("Swapped in the index snapshot published by another process.")
+
+
+async def run_sync_loop(interval=INDEX_SYNC_INTERVAL):
+    """Pick up files added to, changed in or removed from the upload directory."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(follow_rollback)
+            await asyncio.to_thread(sync_index)
+        except Exception as e:
+            logger.error(f"Error syncing the index: {e}")
+
+
+async def main():
+    load_environment()
+    init_db()
+    await asyncio.to_thread(load_or_create_index)
+    await asyncio.to_thread(load_interaction_segment)
+
+    # Workers queue interactions in the database; the queue's trigger wakes the ingest loop here
+    loop = asyncio.get_running_loop()
+    wake = lambda *_: loop.call_soon_threadsafe(request_ingest)
+    NotificationListener(
+        DATABASE_URL,
+        # Off the listener thread, which would otherwise wait on the write lock during a build
+        {INGEST_CHANNEL: wake,
+         INDEX_CHANNEL: lambda _: threading.Thread(target=follow_rollback, daemon=True).start()},
+        on_reconnect=wake,
+        session_setup=SESSION_SETUP,
+    ).start()
+    logger.info("Index builder running.")
+    await asyncio.gather(run_ingest_loop(), run_sync_loop())
+
+
+def rollback(version=None):
+    load_environment()
+    version = rollback_index(version)
+    print(f"Rolled the index back to snapshot {version}.")
+
+
+def rebuild():
+    load_environment()
+    build_new_index(force=True)
+    print(f"Snapshot {os.path.basename(current_snapshot_dir())} is live.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rollback", nargs="?", const="", metavar="VERSION",
+                        help="serve an earlier corpus snapshot (default: the one before the live one) and exit")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="publish a full rebuild of the corpus index, replacing a pinned rollback, and exit")
+    args = parser.parse_args()
+    if args.rollback is not None:
+        rollback(args.rollback or None)
+    elif args.rebuild:
+        rebuild()
+    else:
+        asyncio.run(main())
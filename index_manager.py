@@ -1,10 +1,39 @@
 from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
-from document_loader import load_documents
-from database_manager import get_conversation_history
+from document_loader import (iter_file_chunks, create_parse_executor, batched,
+                             fallback_documents, scan_upload_dir, file_fingerprint, FALLBACK_CHUNK_ID)
+from database_manager import (get_pending_index_documents, mark_index_documents_processed,
+                              requeue_index_documents, get_interaction_states, get_helpful_interactions,
+                              advisory_lock, notify)
+from embedding_cache import CachedEmbeddings
+from ann_index import build_settings, build_index, configure_search, supports_positional_remove
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from answer_cache import answer_cache
+from example_store import example_store
+from local_models import create_embeddings
+from notifications import INDEX_CHANNEL
+from observability import stage_timer, observe_stage, log_payload
+from context_builder import pack_context, count_tokens
+from config import (INDEX_DIR, INDEX_MMAP, INDEX_KEEP_SNAPSHOTS, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL,
+                    INDEX_TYPE, INGEST_BATCH_SIZE, HISTORY_WINDOW, INDEX_INGEST_INTERVAL, INDEX_INGEST_DELAY,
+                    INTERACTION_INDEX_DIR, INTERACTION_INDEX_MAX_DOCS, INTERACTION_INDEX_MAX_AGE_DAYS,
+                    INTERACTION_DEDUP_THRESHOLD, INTERACTION_COMPACT_INTERVAL, INTERACTION_SEARCH_MAX,
+                    RETRIEVAL_MODE, RETRIEVAL_CANDIDATES, RETRIEVAL_RRF_K, RETRIEVAL_EMBED_TIMEOUT, MODEL_BACKEND,
+                    CONTEXT_CANDIDATES, EXAMPLE_STORE_MAX_ENTRIES, INDEX_ROLE, INDEX_POLL_INTERVAL,
+                    INDEX_MIN_DOC_RATIO, INDEX_PROBE_SAMPLE, INDEX_PROBE_MIN_RECALL, INDEX_PROBE_QUERIES)
+import asyncio
+import faiss
+import json
 import logging
+import numpy as np
 import os
+import pickle
+import shutil
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
 from dotenv import load_dotenv
 
 # Set up logging
@@ -13,46 +42,511 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
-print(f"Key: {openai_api_key}")
-if not openai_api_key:
+if MODEL_BACKEND == "openai" and not openai_api_key:
     raise ValueError(
         "Please set the OPENAI_API_KEY environment variable in the .env file."
     )
 
-embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
+# Indexing, retrieval and interaction ingestion all embed through this shared cache
+embeddings = CachedEmbeddings(
+    create_embeddings(openai_api_key),
+    model=EMBEDDING_MODEL,
+)
+# The index has two segments: the curated corpus, rebuilt or synced from the upload directory,
+# and a small capped segment of past interactions fed by the ingest queue
 vectorstore = None
+interaction_store = None
+# BM25 index over the corpus segment, published and loaded with each corpus snapshot
+lexical_index = None
+# Corpus version of the live store, used to key cached answers
+index_version = None
+# Snapshot directory last loaded or published per segment root, so workers can tell when the builder publishes
+seen_snapshots = {}
+
+# Serialize writers per segment; readers keep using whichever store the globals point at
+index_write_lock = threading.RLock()
+interaction_write_lock = threading.RLock()
+# State of the last corpus build started through start_index_build, for the admin endpoint
+index_build = {"state": "idle", "full": None, "started_at": None, "finished_at": None, "version": None, "error": None}
+index_build_lock = threading.Lock()
+# Set whenever an interaction is queued for indexing
+ingest_requested = asyncio.Event()
+# Set when the index builder announces a new snapshot, so workers need not wait for the next poll
+snapshot_published = asyncio.Event()
+# Postgres advisory lock key held by the process draining the ingest queue
+INDEX_INGEST_LOCK_KEY = 0x444D5501
+
+# Bump when the on-disk snapshot layout changes so old snapshots are rebuilt
+# 2: chunks carry a token_count in their metadata
+INDEX_FORMAT_VERSION = 2
+MANIFEST_FILE = "manifest.json"
+LEXICAL_FILE = "lexical.pkl"
+CURRENT_FILE = "CURRENT"
+# Written by rollback_index; automatic syncs leave a pinned index alone until a forced build
+PINNED_FILE = "PINNED"
 
 # embeddings = OpenAIEmbeddings()
 # vectorstore = None  # Initialize the global variable
 
 
-def create_new_index():
-    global vectorstore
+def index_settings():
+    """Settings a snapshot depends on; a change to any of them requires a full rebuild."""
+    return {
+        "format_version": INDEX_FORMAT_VERSION,
+        "embedding_model": EMBEDDING_MODEL,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        **build_settings(),
+    }
+
+
+def build_manifest(sources):
+    # sources maps each ingested file to its fingerprint and the ids of its chunks
+    return dict(index_settings(), sources=sources)
+
+
+def current_snapshot_dir(root=INDEX_DIR):
     try:
-        docs = load_documents()
-        if not docs:
-            logger.warning("No documents loaded. Using fallback document.")
-            docs = [
-                Document(
-                    page_content="Fallback document content.",
-                    metadata={"source": "fallback"},
-                )
-            ]
-        else:
-            logger.info(f"Loaded {len(docs)} documents.")
-            for doc in docs:
-                logger.info(
-                    f"Document content (first 100 chars): {doc.page_content[:100]}..."
-                )
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(root, version)
+    return path if version and os.path.isdir(path) else None
+
+
+def read_manifest(snapshot_dir):
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def load_snapshot(snapshot_dir, manifest):
+    # The snapshot is written by this process family only, so unpickling the docstore is safe
+    index_path = os.path.join(snapshot_dir, "index.faiss")
+    index = None
+    # faiss only memory-maps IVF inverted lists; other index types are read into memory either way.
+    # Mapped inverted lists cannot be cloned for an update, so only workers, which never update
+    # their index, map them
+    if INDEX_MMAP and INDEX_ROLE == "worker" and manifest.get("index_type") in ("ivf", "ivfpq"):
+        try:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logger.info(f"Cannot memory-map {index_path}, reading it instead: {e}")
+    if index is None:
+        index = faiss.read_index(index_path)
+    with open(os.path.join(snapshot_dir, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, configure_search(index), docstore, index_to_docstore_id)
+
+
+def stale_setting(manifest):
+    """The first setting the snapshot was built with that differs from the current ones, or None."""
+    return next((key for key, value in index_settings().items() if manifest.get(key) != value), None)
+
+
+def load_valid_snapshot():
+    global index_version
+    snapshot_dir = current_snapshot_dir()
+    if snapshot_dir is None:
+        logger.info("No index snapshot found on disk.")
+        return None
+    try:
+        manifest = read_manifest(snapshot_dir)
+        key = stale_setting(manifest)
+        if key is not None:
+            logger.info(f"Index snapshot {snapshot_dir} is stale ({key} changed).")
+            seen_snapshots[INDEX_DIR] = snapshot_dir
+            return None
+        store = load_snapshot(snapshot_dir, manifest)
+        load_lexical_index(snapshot_dir, store)
+        seen_snapshots[INDEX_DIR] = snapshot_dir
+        index_version = manifest.get("corpus_version", manifest.get("version"))
+        logger.info(f"Loaded index snapshot {snapshot_dir} with {store.index.ntotal} vectors.")
+        return store
+    except Exception as e:
+        logger.error(f"Error loading index snapshot {snapshot_dir}: {e}")
+        return None
+
+
+def build_lexical_index(store):
+    documents = store.docstore._dict
+    return BM25Index.from_documents(
+        {doc_id: documents[doc_id] for _, doc_id in sorted(store.index_to_docstore_id.items())}
+    )
+
+
+def read_lexical_index(snapshot_dir, store):
+    try:
+        with open(os.path.join(snapshot_dir, LEXICAL_FILE), "rb") as f:
+            return pickle.load(f).attach(store.docstore._dict)
+    except FileNotFoundError:
+        logger.info(f"No lexical index in {snapshot_dir}; building it.")
+        return build_lexical_index(store)
+
+
+def load_lexical_index(snapshot_dir, store):
+    global lexical_index
+    lexical_index = read_lexical_index(snapshot_dir, store)
+    return lexical_index
+
+
+def write_snapshot(store, manifest, root, version=None, extra_files=None):
+    """Write the store (and any `extra_files` objects, pickled) to a new versioned directory under
+    `root` and atomically point CURRENT at it."""
+    os.makedirs(root, exist_ok=True)
+    version = version or datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+    final_dir = os.path.join(root, version)
+    tmp_dir = f"{final_dir}.tmp"
+
+    store.save_local(tmp_dir)
+    for name, obj in (extra_files or {}).items():
+        with open(os.path.join(tmp_dir, name), "wb") as f:
+            pickle.dump(obj, f)
+    manifest = dict(manifest, version=version, doc_count=store.index.ntotal,
+                    created_at=datetime.utcnow().isoformat())
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_dir, final_dir)
+
+    point_current(root, version)
+    logger.info(f"Published index snapshot {final_dir}.")
+
+    prune_snapshots(keep=version, root=root)
+    return final_dir
+
+
+def point_current(root, version):
+    """Atomically make `version` the snapshot every process under `root` serves."""
+    current_tmp = os.path.join(root, f"{CURRENT_FILE}.tmp")
+    with open(current_tmp, "w") as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(root, CURRENT_FILE))
+    seen_snapshots[root] = os.path.join(root, version)
+    if INDEX_ROLE == "builder":
+        announce_snapshot(root, version)
+
+
+def pinned_version(root=INDEX_DIR):
+    try:
+        with open(os.path.join(root, PINNED_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def pin_index(root, version):
+    pinned_tmp = os.path.join(root, f"{PINNED_FILE}.tmp")
+    with open(pinned_tmp, "w") as f:
+        f.write(version)
+    os.replace(pinned_tmp, os.path.join(root, PINNED_FILE))
+
 
-        logger.info("Creating embeddings...")
-        vectorstore = FAISS.from_documents(docs, embeddings)
-        logger.info(f"Created vectorstore with {len(docs)} documents.")
+def unpin_index(root=INDEX_DIR):
+    try:
+        os.remove(os.path.join(root, PINNED_FILE))
+    except FileNotFoundError:
+        return
+    logger.info("The index is no longer pinned to a rolled-back snapshot.")
+
+
+def announce_snapshot(root, version):
+    # Workers also poll CURRENT, so a lost notification only delays the swap
+    try:
+        notify(INDEX_CHANNEL, json.dumps({"root": root, "version": version}))
+    except Exception as e:
+        logger.warning(f"Could not announce index snapshot {version}: {e}")
+
+
+class IndexValidationError(Exception):
+    pass
+
+
+def validate_store(store, force=False):
+    """Raise IndexValidationError unless `store` is fit to replace the live corpus index.
+
+    Checks that the index and docstore agree, that the store keeps at least INDEX_MIN_DOC_RATIO
+    of the live store's chunks (skipped when `force`), that a sample of chunks retrieves itself,
+    and that every INDEX_PROBE_QUERIES query returns results. Probe embeddings of indexed
+    chunks come from the embedding cache.
+    """
+    count = store.index.ntotal
+    if not count:
+        raise IndexValidationError("The index is empty.")
+    if count != len(store.index_to_docstore_id) or any(
+        doc_id not in store.docstore._dict for doc_id in store.index_to_docstore_id.values()
+    ):
+        raise IndexValidationError("The index and its docstore disagree.")
+    live_count = vectorstore.index.ntotal if vectorstore is not None else 0
+    if not force and count < live_count * INDEX_MIN_DOC_RATIO:
+        raise IndexValidationError(
+            f"The index has {count} chunks, down from {live_count}; rebuild with force to accept this."
+        )
+
+    if INDEX_PROBE_SAMPLE:
+        doc_ids = [doc_id for _, doc_id in sorted(store.index_to_docstore_id.items())]
+        sample = [store.docstore._dict[doc_id] for doc_id in doc_ids[::max(1, count // INDEX_PROBE_SAMPLE)][:INDEX_PROBE_SAMPLE]]
+        vectors = embeddings.embed_documents([doc.page_content for doc in sample])
+        found = 0
+        for doc, vector in zip(sample, vectors):
+            results = store.similarity_search_by_vector(vector, k=RETRIEVAL_CANDIDATES)
+            # Identical chunks (repeated FAQ answers) are interchangeable
+            found += any(result.page_content == doc.page_content for result in results)
+        recall = found / len(sample)
+        if recall < INDEX_PROBE_MIN_RECALL:
+            raise IndexValidationError(f"Only {recall:.0%} of sampled chunks retrieve themselves.")
+    for query in INDEX_PROBE_QUERIES:
+        if not store.similarity_search_by_vector(embeddings.embed_query(query), k=1):
+            raise IndexValidationError(f"Probe query {query!r} returned nothing.")
 
+
+def publish_snapshot(store, manifest, corpus_changed=True, force=False):
+    """Validate and publish a corpus snapshot; raises IndexValidationError if the store fails validation.
+
+    Pass corpus_changed=False when no corpus chunk changed, to keep the corpus version.
+    """
+    global index_version, lexical_index
+    validate_store(store, force=force)
+    version = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+    corpus_version = version
+    if not corpus_changed:
+        corpus_version = manifest.get("corpus_version", manifest.get("version", version))
+    lexical = build_lexical_index(store)
+    final_dir = write_snapshot(store, dict(manifest, corpus_version=corpus_version), INDEX_DIR, version,
+                               extra_files={LEXICAL_FILE: lexical})
+    index_version = corpus_version
+    lexical_index = lexical
+    return final_dir
+
+
+def prune_snapshots(keep, root=INDEX_DIR):
+    # Snapshot directories are named by timestamp; anything else (such as the interaction
+    # segment's directory) is left alone
+    versions = sorted(
+        name for name in os.listdir(root)
+        if name.isdigit() and os.path.isdir(os.path.join(root, name))
+    )
+    old_versions = [v for v in versions if v != keep][:-INDEX_KEEP_SNAPSHOTS or None]
+    for version in old_versions:
+        shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+
+
+def clone_store(store):
+    """Private writable copy of a store, so the live one keeps serving while it is modified."""
+    return FAISS(
+        embeddings,
+        faiss.clone_index(store.index),
+        InMemoryDocstore(dict(store.docstore._dict)),
+        dict(store.index_to_docstore_id),
+    )
+
+
+def rebuild_store(documents_by_id):
+    """Store of the configured index type over the given {chunk_id: Document}, in order.
+
+    Embeddings come from the embedding cache, so this costs little beyond training the index.
+    """
+    ids = list(documents_by_id)
+    documents = [documents_by_id[doc_id] for doc_id in ids]
+    vectors = embeddings.embed_documents([doc.page_content for doc in documents])
+    return FAISS(
+        embeddings,
+        build_index(np.asarray(vectors, dtype="float32")),
+        InMemoryDocstore(dict(zip(ids, documents))),
+        dict(enumerate(ids)),
+    )
+
+
+def convert_store(store):
+    """Re-index a freshly built flat store into the configured INDEX_TYPE."""
+    if INDEX_TYPE == "flat":
+        return store
+    vectors = store.index.reconstruct_n(0, store.index.ntotal)
+    return FAISS(embeddings, build_index(vectors), store.docstore, store.index_to_docstore_id)
+
+
+def delete_chunks(store, chunk_ids):
+    """Delete chunks from a writable store, returning the resulting store.
+
+    Index types that cannot remove vectors in place are rebuilt from the remaining chunks.
+    """
+    if supports_positional_remove(store.index):
+        store.delete(list(chunk_ids))
+        return store
+    chunk_ids = set(chunk_ids)
+    remaining = {
+        doc_id: store.docstore._dict[doc_id]
+        for _, doc_id in sorted(store.index_to_docstore_id.items())
+        if doc_id not in chunk_ids
+    }
+    logger.info(f"Rebuilding the {INDEX_TYPE} index to delete {len(chunk_ids)} chunks.")
+    return rebuild_store(remaining)
+
+
+def add_chunk_batch(store, chunks):
+    ids = [chunk.metadata["chunk_id"] for chunk in chunks]
+    if store is None:
+        return FAISS.from_documents(chunks, embeddings, ids=ids)
+    store.add_documents(chunks, ids=ids)
+    return store
+
+
+def build_new_index(force=False):
+    """Build the corpus index from scratch and swap it in once it passes validation.
+
+    The live index keeps serving throughout; if validation fails it stays live and
+    IndexValidationError is raised. A live index pinned by a rollback is only replaced when `force`.
+    """
+    global vectorstore
+    snapshot_dir = current_snapshot_dir()
+    if not force and vectorstore is not None and pinned_version():
+        logger.info(f"The index is pinned to snapshot {pinned_version()}; skipping the build.")
         return vectorstore
+    pdf_paths = scan_upload_dir()
+    sources = {}
+
+    # Chunks stream in from the parser pool and are embedded and indexed one batch at a time
+    logger.info("Creating embeddings...")
+    store = None
+    chunk_count = 0
+    with create_parse_executor() as executor:
+        for path in pdf_paths:
+            sha256 = file_fingerprint(path)
+            chunk_ids = []
+            try:
+                for batch in batched(iter_file_chunks(path, executor), INGEST_BATCH_SIZE):
+                    store = add_chunk_batch(store, batch)
+                    chunk_ids.extend(chunk.metadata["chunk_id"] for chunk in batch)
+                    chunk_count += len(batch)
+                    logger.info(f"Indexed {chunk_count} chunks so far.")
+            except Exception as e:
+                # Left out of the manifest, so the next sync parses the file again
+                logger.error(f"Error loading {path}: {str(e)}")
+                if chunk_ids:
+                    store = delete_chunks(store, chunk_ids)
+                    chunk_count -= len(chunk_ids)
+                    if not store.index.ntotal:
+                        store = None
+                continue
+            sources[path] = {"sha256": sha256, "chunk_ids": chunk_ids}
+
+    if store is None:
+        logger.warning("No documents loaded. Using fallback document.")
+        store = add_chunk_batch(None, fallback_documents())
+    store = convert_store(store)
+    logger.info(f"Created vectorstore with {store.index.ntotal} documents.")
+    logger.info(f"Embedding cache stats: {embeddings.stats()}")
+
+    with index_write_lock:
+        if current_snapshot_dir() != snapshot_dir:
+            # Another process (index_builder.py --rollback) moved CURRENT; publishing would undo that
+            logger.warning("The live index snapshot changed during the build; discarding the built index.")
+            return vectorstore
+        try:
+            publish_snapshot(store, build_manifest(sources), force=force)
+            unpin_index()
+        except IndexValidationError:
+            raise
+        except Exception as e:
+            logger.error(f"Error saving index snapshot: {e}")
+        vectorstore = store
+    return vectorstore
+
+
+def create_new_index():
+    # Returns the live store, which is left as it was if the build fails
+    try:
+        return build_new_index()
     except Exception as e:
         logger.error(f"Error creating new index: {e}")
-        return None
+        return vectorstore
+
+
+def sync_index():
+    try:
+        return apply_upload_changes()
+    except Exception as e:
+        logger.error(f"Error syncing index: {e}")
+        return vectorstore
+
+
+def apply_upload_changes(force=False):
+    """Apply only the chunk adds/deletes implied by changes in the upload directory.
+
+    The diff is applied to a copy of the live store, which is validated, published as a new
+    snapshot and swapped in at the end, so questions keep being served from the old index meanwhile.
+    Nothing is synced into an index pinned by a rollback unless `force`.
+    """
+    global vectorstore
+    snapshot_dir = current_snapshot_dir()
+    if vectorstore is None or snapshot_dir is None:
+        return build_new_index(force)
+    if not force and pinned_version():
+        # Syncing the unchanged upload directory would republish what was just rolled back
+        logger.info(f"The index is pinned to snapshot {pinned_version()}; skipping the sync.")
+        return vectorstore
+
+    with index_write_lock:
+        manifest = read_manifest(snapshot_dir)
+        old_sources = manifest.get("sources", {})
+        current = {path: file_fingerprint(path) for path in scan_upload_dir()}
+
+        changed = [path for path, sha in current.items() if old_sources.get(path, {}).get("sha256") != sha]
+        removed = [path for path in old_sources if path not in current]
+        if not changed and not removed:
+            logger.info("Index is up to date with the upload directory.")
+            return vectorstore
+
+        store = clone_store(vectorstore)
+        sources = {path: old_sources[path] for path in current if path not in changed}
+        to_delete = set()
+        added_count = 0
+        for path in removed:
+            to_delete.update(old_sources[path]["chunk_ids"])
+
+        if changed:
+            with create_parse_executor() as executor:
+                for path in changed:
+                    old_ids = set(old_sources.get(path, {}).get("chunk_ids", []))
+                    new_ids = []
+                    added_ids = []
+                    try:
+                        for batch in batched(iter_file_chunks(path, executor), INGEST_BATCH_SIZE):
+                            new_ids.extend(chunk.metadata["chunk_id"] for chunk in batch)
+                            new_chunks = [chunk for chunk in batch if chunk.metadata["chunk_id"] not in old_ids]
+                            if new_chunks:
+                                add_chunk_batch(store, new_chunks)
+                                added_ids.extend(chunk.metadata["chunk_id"] for chunk in new_chunks)
+                    except Exception as e:
+                        # Leave the file as it was in the previous snapshot
+                        logger.error(f"Error loading {path}: {str(e)}")
+                        if added_ids:
+                            store = delete_chunks(store, added_ids)
+                        if path in old_sources:
+                            sources[path] = old_sources[path]
+                        continue
+                    to_delete.update(old_ids - set(new_ids))
+                    added_count += len(added_ids)
+                    sources[path] = {"sha256": current[path], "chunk_ids": new_ids}
+
+        present_ids = set(store.index_to_docstore_id.values())
+        if added_count and FALLBACK_CHUNK_ID in present_ids:
+            to_delete.add(FALLBACK_CHUNK_ID)
+        to_delete &= present_ids
+        if to_delete:
+            store = delete_chunks(store, to_delete)
+        logger.info(
+            f"Synced index: {len(changed)} changed and {len(removed)} removed files, "
+            f"{added_count} chunks added, {len(to_delete)} chunks deleted."
+        )
+
+        if current_snapshot_dir() != snapshot_dir:
+            # Another process (index_builder.py --rollback) moved CURRENT; publishing would undo that
+            logger.warning("The live index snapshot changed during the sync; discarding the synced index.")
+            return vectorstore
+        publish_snapshot(store, build_manifest(sources), force=force)
+        unpin_index()
+        vectorstore = store
+    return vectorstore
 
 
 def load_or_create_index(force_update=False):
@@ -60,68 +554,522 @@ def load_or_create_index(force_update=False):
     if vectorstore is not None and not force_update:
         logger.info("Using existing index.")
         return vectorstore
-    else:
-        logger.info("Creating new index.")
-        return create_new_index()
-
+    if INDEX_ROLE == "worker":
+        # Only the index builder writes snapshots; workers serve whichever one it last published
+        vectorstore = load_valid_snapshot()
+        if vectorstore is None:
+            logger.warning("No usable index snapshot yet; waiting for the index builder to publish one.")
+        return vectorstore
+    if not force_update:
+        snapshot = load_valid_snapshot()
+        if snapshot is not None:
+            vectorstore = remove_interaction_documents(snapshot)
+            return sync_index()
+    logger.info("Creating new index.")
+    return create_new_index()
 
-def update_index_with_interaction(question, answer, conversation_id):
-    global vectorstore
-    if vectorstore is None:
-        vectorstore = create_new_index()
 
-    conversation_history = get_conversation_history(conversation_id)
-    recent_history = conversation_history[-6:]  # Get last 6 interactions
+def interaction_document_text(question, answer, conversation_id, conversation_history):
+    """Index text for a turn, given the history that preceded it."""
+    recent_history = conversation_history[-HISTORY_WINDOW:]
     history_str = "\n".join([f"Q: {q}\nA: {a}" for q, a, _ in recent_history])
+    return f"Conversation ID: {conversation_id}\nRecent History:\n{history_str}\nQ: {question}\nA: {answer}"
+
 
-    new_doc = Document(
-        page_content=f"Conversation ID: {conversation_id}\nRecent History:\n{history_str}\nQ: {question}\nA: {answer}",
-        metadata={"source": "user_interaction", "conversation_id": conversation_id},
+def interaction_document(interaction_id, conversation_id, content):
+    return Document(
+        page_content=content,
+        metadata={
+            "source": "user_interaction",
+            "conversation_id": conversation_id,
+            "interaction_id": interaction_id,
+            "chunk_id": f"interaction-{interaction_id}",
+            "token_count": count_tokens(content),
+        },
     )
-    vectorstore.add_documents([new_doc])
-    logger.info(
-        f"Added new interaction to the index for conversation {conversation_id}"
+
+
+def remove_interaction_documents(store):
+    """Move a corpus store off interaction documents added before the segments were split."""
+    doc_ids = [
+        doc_id for doc_id, doc in store.docstore._dict.items()
+        if doc.metadata.get("source") == "user_interaction"
+    ]
+    if not doc_ids:
+        return store
+    store = delete_chunks(clone_store(store), doc_ids)
+    publish_snapshot(store, read_manifest(current_snapshot_dir()), corpus_changed=False, force=True)
+    logger.info(f"Removed {len(doc_ids)} interaction documents from the corpus index.")
+    return store
+
+
+def interaction_settings():
+    return {"format_version": INDEX_FORMAT_VERSION, "embedding_model": EMBEDDING_MODEL}
+
+
+def load_interaction_segment():
+    """Load the interaction segment, or queue the latest interactions to rebuild it."""
+    global interaction_store
+    snapshot_dir = current_snapshot_dir(INTERACTION_INDEX_DIR)
+    if snapshot_dir is not None:
+        try:
+            manifest = read_manifest(snapshot_dir)
+            if all(manifest.get(key) == value for key, value in interaction_settings().items()):
+                interaction_store = load_snapshot(snapshot_dir, manifest)
+                seen_snapshots[INTERACTION_INDEX_DIR] = snapshot_dir
+                logger.info(f"Loaded interaction segment with {interaction_store.index.ntotal} documents.")
+                return interaction_store
+            logger.info("Interaction segment snapshot is stale.")
+            seen_snapshots[INTERACTION_INDEX_DIR] = snapshot_dir
+        except Exception as e:
+            logger.error(f"Error loading interaction segment {snapshot_dir}: {e}")
+
+    if INDEX_ROLE == "worker":
+        # The index builder rebuilds the segment; it is swapped in once published
+        return interaction_store
+
+    # The ingest queue keeps every interaction document, so the segment is rebuilt from it
+    interaction_store = None
+    requeued = requeue_index_documents(INTERACTION_INDEX_MAX_DOCS)
+    logger.info(f"Rebuilding the interaction segment from {requeued} queued interactions.")
+    request_ingest()
+    return None
+
+
+def cosine_similarities(matrix, vector):
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector)
+    return (matrix @ vector) / np.where(norms == 0, 1, norms)
+
+
+def add_interaction_batch(store, documents):
+    """Embed and add interaction documents, replacing near-duplicates with the newer document.
+
+    Returns the updated store and the ids of the documents that were replaced.
+    """
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in documents], persist=False),
+                         dtype="float32")
+
+    # Within the batch the later of two near-duplicates wins
+    kept = []
+    for i in range(len(documents)):
+        if kept:
+            similarities = cosine_similarities(vectors[kept], vectors[i])
+            best = int(np.argmax(similarities))
+            if similarities[best] >= INTERACTION_DEDUP_THRESHOLD:
+                kept.pop(best)
+        kept.append(i)
+
+    replaced = set()
+    if store is not None and store.index.ntotal:
+        _, positions = store.index.search(vectors[kept], 1)
+        for i, position in zip(kept, positions[:, 0]):
+            if position < 0:
+                continue
+            existing = store.index.reconstruct(int(position))
+            if cosine_similarities(existing[None, :], vectors[i])[0] >= INTERACTION_DEDUP_THRESHOLD:
+                replaced.add(store.index_to_docstore_id[int(position)])
+
+    text_embeddings = [(documents[i].page_content, vectors[i].tolist()) for i in kept]
+    metadatas = [documents[i].metadata for i in kept]
+    ids = [documents[i].metadata["chunk_id"] for i in kept]
+    if store is None:
+        return FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids), replaced
+    if replaced:
+        store.delete(list(replaced))
+    store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return store, replaced
+
+
+def evict_oldest_interactions(store, max_docs=INTERACTION_INDEX_MAX_DOCS):
+    excess = store.index.ntotal - max_docs
+    if excess <= 0:
+        return 0
+    oldest = sorted(store.docstore._dict.items(), key=lambda item: item[1].metadata.get("interaction_id", 0))
+    store.delete([doc_id for doc_id, _ in oldest[:excess]])
+    return excess
+
+
+def publish_interaction_segment(store):
+    global interaction_store
+    write_snapshot(store, interaction_settings(), INTERACTION_INDEX_DIR)
+    interaction_store = store
+
+
+def drain_ingest_queue(batch_size=INGEST_BATCH_SIZE):
+    """Apply every pending interaction document to the interaction segment; returns how many were applied.
+
+    Only one process drains at a time (advisory lock). Documents are embedded a batch at a
+    time into a copy of the live segment, which is published as a snapshot and swapped in
+    before the queue rows are marked processed. A crash in between only replays rows,
+    and replayed documents are skipped because the segment already holds them. A queued
+    document for an interaction already in the segment with other text (an improved answer)
+    replaces it.
+    """
+    with advisory_lock(INDEX_INGEST_LOCK_KEY) as acquired:
+        if not acquired:
+            logger.info("Another process is draining the index ingest queue.")
+            return 0
+        with interaction_write_lock:
+            start = time.perf_counter()
+            store = clone_store(interaction_store) if interaction_store is not None else None
+            queue_ids = []
+            replaced_count = 0
+            last_id = 0
+            while True:
+                rows = get_pending_index_documents(last_id, batch_size)
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                # The latest row for an interaction wins
+                latest = {interaction_id: (conversation_id, content)
+                          for _, interaction_id, conversation_id, content in rows}
+                present = store.docstore._dict if store is not None else {}
+                documents = []
+                outdated = []
+                for interaction_id, (conversation_id, content) in latest.items():
+                    doc_id = f"interaction-{interaction_id}"
+                    if doc_id in present:
+                        if present[doc_id].page_content == content:
+                            continue
+                        outdated.append(doc_id)
+                    documents.append(interaction_document(interaction_id, conversation_id, content))
+                if outdated:
+                    store.delete(outdated)
+                    replaced_count += len(outdated)
+                if documents:
+                    store, replaced = add_interaction_batch(store, documents)
+                    replaced_count += len(replaced)
+                queue_ids.extend(row[0] for row in rows)
+
+            if not queue_ids:
+                return 0
+            if store is not None:
+                evicted = evict_oldest_interactions(store)
+                publish_interaction_segment(store)
+                logger.info(
+                    f"Interaction segment has {store.index.ntotal} documents "
+                    f"({replaced_count} near-duplicates replaced, {evicted} evicted)."
+                )
+            observe_stage("index", time.perf_counter() - start)
+        mark_index_documents_processed(queue_ids)
+    logger.info(f"Added {len(queue_ids)} interactions to the index.")
+    return len(queue_ids)
+
+
+def compact_interaction_segment():
+    """Drop interactions that were deleted, rated unhelpful, or are older than the age limit."""
+    with advisory_lock(INDEX_INGEST_LOCK_KEY) as acquired:
+        if not acquired:
+            return 0
+        with interaction_write_lock:
+            if interaction_store is None:
+                return 0
+            docs = interaction_store.docstore._dict
+            interaction_ids = {doc.metadata.get("interaction_id") for doc in docs.values()}
+            states = get_interaction_states([i for i in interaction_ids if i is not None],
+                                            INTERACTION_INDEX_MAX_AGE_DAYS)
+            stale = []
+            for doc_id, doc in docs.items():
+                state = states.get(doc.metadata.get("interaction_id"))
+                if state is None or state[0] == 0 or state[1]:
+                    stale.append(doc_id)
+            if not stale:
+                return 0
+            store = clone_store(interaction_store)
+            store.delete(stale)
+            publish_interaction_segment(store)
+    logger.info(f"Compacted the interaction segment: removed {len(stale)} documents.")
+    return len(stale)
+
+
+def request_ingest():
+    """Wake the ingest loop so a newly queued interaction is indexed soon."""
+    ingest_requested.set()
+
+
+async def run_ingest_loop(interval=INDEX_INGEST_INTERVAL, delay=INDEX_INGEST_DELAY):
+    """Drain the ingest queue when woken, and at least every `interval` seconds.
+
+    After a wake-up it waits `delay` seconds so interactions arriving together share a batch.
+    The interaction segment is compacted every INTERACTION_COMPACT_INTERVAL seconds.
+    """
+    last_compaction = time.monotonic()
+    while True:
+        try:
+            await asyncio.wait_for(ingest_requested.wait(), timeout=interval)
+            await asyncio.sleep(delay)
+        except asyncio.TimeoutError:
+            pass
+        ingest_requested.clear()
+        try:
+            await asyncio.to_thread(drain_ingest_queue)
+            if time.monotonic() - last_compaction >= INTERACTION_COMPACT_INTERVAL:
+                last_compaction = time.monotonic()
+                await asyncio.to_thread(compact_interaction_segment)
+        except Exception as e:
+            logger.error(f"Error maintaining the interaction segment: {e}")
+
+
+def refresh_snapshots():
+    """Swap in any corpus or interaction snapshot published since this process last looked.
+
+    Used by workers, which never build; the stores they replace are not modified, so
+    requests already searching them finish undisturbed.
+    """
+    global vectorstore, interaction_store
+    swapped = False
+    corpus_dir = current_snapshot_dir()
+    if corpus_dir is not None and corpus_dir != seen_snapshots.get(INDEX_DIR):
+        previous_version = index_version
+        store = load_valid_snapshot()
+        if store is not None:
+            vectorstore = store
+            swapped = True
+            if index_version != previous_version:
+                # Cached answers are keyed by corpus version and can no longer match
+                answer_cache.clear()
+    interaction_dir = current_snapshot_dir(INTERACTION_INDEX_DIR)
+    if interaction_dir is not None and interaction_dir != seen_snapshots.get(INTERACTION_INDEX_DIR):
+        previous = interaction_store
+        if load_interaction_segment() is not previous:
+            swapped = True
+    return swapped
+
+
+async def run_snapshot_watcher(interval=INDEX_POLL_INTERVAL):
+    """Swap in new snapshots when the builder announces one, and at least every `interval` seconds."""
+    while True:
+        try:
+            await asyncio.wait_for(snapshot_published.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        snapshot_published.clear()
+        try:
+            await asyncio.to_thread(refresh_snapshots)
+        except Exception as e:
+            logger.error(f"Error refreshing index snapshots: {e}")
+
+
+def load_example_store():
+    """Fill the few-shot example store with the most recent helpful interactions."""
+    rows = get_helpful_interactions(EXAMPLE_STORE_MAX_ENTRIES)
+    vectors = embeddings.embed_documents([question for _, _, question, _ in rows]) if rows else []
+    example_store.load(rows, vectors)
+
+
+def add_example(interaction_id, conversation_id, question, answer):
+    # Called when an interaction is rated helpful; the question is embedded once, here
+    example_store.add(interaction_id, conversation_id, question, answer, embeddings.embed_query(question))
+
+
+def format_history(conversation_history):
+    # Use only the last few interactions to keep context relevant
+    recent_history = conversation_history[-HISTORY_WINDOW:]
+    return "\n".join([f"Human: {q}\nAI: {a}" for q, a, _ in recent_history])
+
+
+def search_segments(query_vector, k=3):
+    """Top-k across the corpus and at most INTERACTION_SEARCH_MAX interaction documents, by distance."""
+    store, interactions = vectorstore, interaction_store
+    if not store:
+        return None
+    results = store.similarity_search_with_score_by_vector(query_vector, k=k)
+    if interactions is not None and INTERACTION_SEARCH_MAX:
+        results += interactions.similarity_search_with_score_by_vector(query_vector, k=min(k, INTERACTION_SEARCH_MAX))
+    results.sort(key=lambda result: result[1])
+    return [doc for doc, _ in results[:k]]
+
+
+def retrieve_documents(query_vector, lexical_query, k=3):
+    """Fuse vector and BM25 results by reciprocal rank; without a query vector only BM25 is used.
+
+    The lexical query is the bare question, so exact terms such as module codes are not diluted
+    by the conversation history that goes into the vector query.
+    """
+    if not vectorstore:
+        return None
+    result_lists = []
+    if query_vector is not None:
+        result_lists.append(search_segments(query_vector, k=RETRIEVAL_CANDIDATES))
+    if lexical_index is not None and (RETRIEVAL_MODE != "vector" or query_vector is None):
+        result_lists.append([doc for doc, _ in lexical_index.search(lexical_query, k=RETRIEVAL_CANDIDATES)])
+    if len(result_lists) == 1:
+        return result_lists[0][:k]
+    return reciprocal_rank_fusion(result_lists, k=RETRIEVAL_RRF_K)[:k]
+
+
+async def aembed_query(search_query):
+    """Query embedding, or None when it fails or takes longer than RETRIEVAL_EMBED_TIMEOUT.
+
+    Retrieval then falls back to BM25 alone rather than waiting on the embedder.
+    """
+    if RETRIEVAL_MODE == "lexical":
+        return None
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(embeddings.embed_query, search_query), RETRIEVAL_EMBED_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"Query embedding took over {RETRIEVAL_EMBED_TIMEOUT}s; using lexical retrieval only.")
+    except Exception as e:
+        logger.warning(f"Query embedding failed ({e}); using lexical retrieval only.")
+    return None
+
+
+def build_context(relevant_docs, conversation_history, examples=(), conversation_id=None):
+    """(context, docs actually used) for the retrieved documents.
+
+    The history is not repeated in the context, since the chain already sends it as messages.
+    """
+    if relevant_docs is None:
+        logger.warning("Vectorstore is not initialized. Returning no context.")
+        return "I don't have specific information about this topic.", None
+
+    context, packed_docs, tokens = pack_context(
+        relevant_docs, conversation_history[-HISTORY_WINDOW:], examples, conversation_id
     )
+    logger.debug(f"Packed {len(packed_docs)} of {len(relevant_docs)} retrieved documents into {tokens} tokens.")
+    for i, doc in enumerate(packed_docs):
+        log_payload(logger, f"Document {i+1} content", doc.page_content, limit=200)
+    return context, packed_docs
 
 
-def get_relevant_context(question, conversation_id):
-    logger.info(f"Getting relevant context for question: {question}")
-    conversation_history = get_conversation_history(conversation_id)
+Retrieval = namedtuple("Retrieval", ["context", "docs", "history", "query_vector", "index_version"])
 
-    # Use only the last 6 interactions to keep context relevant
-    recent_history = conversation_history[-6:]
-    history_str = "\n".join([f"Human: {q}\nAI: {a}" for q, a, _ in recent_history])
 
-    if vectorstore:
-        search_query = f"{question}\n\nRecent context: {history_str}"
-        relevant_docs = vectorstore.similarity_search(search_query, k=3)
-        logger.info(f"Retrieved {len(relevant_docs)} documents:")
-        context_parts = []
-        for i, doc in enumerate(relevant_docs):
-            logger.info(
-                f"Document {i+1} content (first 200 chars): {doc.page_content[:200]}..."
-            )
-            context_parts.append(f"Document {i+1}:\n{doc.page_content}")
+async def aretrieve_context(question, conversation_history, conversation_id=None):
+    """Non-blocking retrieval for a conversation whose history the caller already read.
 
-        context = "\n\n".join(context_parts)
+    The embedding and the index searches run off the event loop. Helpful past answers to
+    similar questions from other conversations are packed in after the retrieved chunks.
+    """
+    log_payload(logger, "Getting relevant context for question", question)
+    history_str = format_history(conversation_history)
+    search_query = f"{question}\n\nRecent context: {history_str}"
+    version = index_version
+    with stage_timer("embed"):
+        # Examples are embedded from their bare question, so they are matched without the history
+        if conversation_history:
+            query_vector, example_vector = await asyncio.gather(aembed_query(search_query), aembed_query(question))
+        else:
+            query_vector = example_vector = await aembed_query(search_query)
+    with stage_timer("search"):
+        relevant_docs = await asyncio.to_thread(retrieve_documents, query_vector, question, CONTEXT_CANDIDATES)
+    examples = example_store.select(example_vector, exclude_conversation=conversation_id)
+    context, packed_docs = build_context(relevant_docs, conversation_history, examples, conversation_id)
+    return Retrieval(context, packed_docs, conversation_history, query_vector, version)
 
-        return f"Relevant context:\n{context}\n\nRecent history:\n{history_str}"
-    else:
-        logger.warning(
-            "Vectorstore is not initialized. Returning only conversation history."
-        )
-        return f"I don't have specific information about this topic. Recent conversation:\n{history_str}"
 
+def run_index_build(full=False, force=False):
+    """Rebuild (full) or sync the corpus index, recording the outcome in `index_build`.
 
-# Initialize the vectorstore
-vectorstore = load_or_create_index()
+    The new snapshot is only swapped in if it passes validate_store; `force` skips the
+    doc-count check for deliberate large deletions and replaces an index pinned by a rollback.
+    Returns whether the build succeeded.
+    """
+    previous_version = index_version
+    try:
+        if not force and pinned_version():
+            raise ValueError(f"The index is pinned to rolled-back snapshot {pinned_version()}; "
+                             f"build with force to replace it.")
+        if full:
+            build_new_index(force)
+        else:
+            apply_upload_changes(force)
+    except Exception as e:
+        logger.error(f"Index build failed; the live index is unchanged: {e}")
+        with index_build_lock:
+            index_build.update(state="failed", finished_at=datetime.utcnow().isoformat(), error=str(e))
+        return False
+    if index_version != previous_version:
+        # Cached answers were generated from the previous index
+        answer_cache.clear()
+    with index_build_lock:
+        index_build.update(state="succeeded", finished_at=datetime.utcnow().isoformat(),
+                           version=os.path.basename(seen_snapshots.get(INDEX_DIR, "")) or None)
+    return True
 
 
-def refresh_index():
-    global vectorstore
+def start_index_build(full=False, force=False):
+    """Run run_index_build in a background thread; returns False if a build is already running."""
+    with index_build_lock:
+        if index_build["state"] == "running":
+            return False
+        index_build.update(state="running", full=full, started_at=datetime.utcnow().isoformat(),
+                           finished_at=None, version=None, error=None)
+    threading.Thread(target=run_index_build, args=(full, force), name="index-build", daemon=True).start()
+    return True
+
+
+def rollback_index(version=None):
+    """Serve an earlier corpus snapshot: `version`, or by default the one before the live one.
+
+    Only the CURRENT pointer moves, so workers follow as they would a new snapshot, and the
+    rolled-back-from snapshot stays on disk until pruned. The index stays pinned to `version`,
+    so syncs do not republish what was rolled back, until a forced build. Returns the version now live.
+    """
+    global vectorstore, lexical_index, index_version
+    with index_write_lock:
+        versions = [snapshot["version"] for snapshot in list_snapshots()]
+        live = os.path.basename(current_snapshot_dir() or "")
+        if version is None:
+            older = [v for v in versions if v < live]
+            if not older:
+                raise ValueError("There is no earlier index snapshot to roll back to.")
+            version = older[-1]
+        elif version not in versions:
+            raise ValueError(f"Unknown index snapshot {version}.")
+        snapshot_dir = os.path.join(INDEX_DIR, version)
+        manifest = read_manifest(snapshot_dir)
+        key = stale_setting(manifest)
+        if key is not None:
+            raise ValueError(f"Index snapshot {version} was built with a different {key}.")
+        store = load_snapshot(snapshot_dir, manifest)
+        lexical = read_lexical_index(snapshot_dir, store)
+        pin_index(INDEX_DIR, version)
+        point_current(INDEX_DIR, version)
+        vectorstore, lexical_index = store, lexical
+        index_version = manifest.get("corpus_version", version)
+    answer_cache.clear()
+    logger.info(f"Rolled the index back to snapshot {version}.")
+    return version
+
+
+def list_snapshots(root=INDEX_DIR):
+    snapshots = []
+    for name in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        if not name.isdigit() or not os.path.isdir(os.path.join(root, name)):
+            continue
+        try:
+            manifest = read_manifest(os.path.join(root, name))
+        except (OSError, ValueError):
+            continue
+        snapshots.append({"version": name, "doc_count": manifest.get("doc_count"),
+                          "created_at": manifest.get("created_at"), "corpus_version": manifest.get("corpus_version")})
+    return snapshots
+
+
+def index_status():
+    with index_build_lock:
+        build = dict(index_build)
+    store = vectorstore
+    return {
+        "role": INDEX_ROLE,
+        "live": {
+            "version": os.path.basename(seen_snapshots.get(INDEX_DIR, "")) or None,
+            "corpus_version": index_version,
+            "doc_count": store.index.ntotal if store is not None else 0,
+            "interaction_count": interaction_store.index.ntotal if interaction_store is not None else 0,
+        },
+        "current": os.path.basename(current_snapshot_dir() or "") or None,
+        "pinned": pinned_version(),
+        "snapshots": list_snapshots(),
+        "build": build,
+    }
+
+
+def refresh_index(full=False):
     logger.info("Refreshing index with latest documents...")
-    vectorstore = create_new_index()
-    logger.info("Index refreshed.")
+    if run_index_build(full):
+        logger.info("Index refreshed.")
 
 
 # You might want to call this function periodically or on-demand
@@ -0,0 +1,97 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i if in is it its me my of on or "
+    "our so that the their there this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    # Module codes, room numbers and dates survive as single tokens ("imat5262", "2024")
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over document chunks, keyed by chunk id.
+
+    Only ids, postings and lengths are pickled; documents are attached from the vector
+    store's docstore after loading, so the text is not stored twice.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids = []
+        self.doc_lengths = []
+        self.postings = defaultdict(list)  # term -> [(doc index, term frequency)]
+        self.total_length = 0
+        self.documents = {}
+
+    @classmethod
+    def from_documents(cls, documents_by_id, **kwargs):
+        index = cls(**kwargs)
+        for doc_id, document in documents_by_id.items():
+            index.add(doc_id, document)
+        return index
+
+    def add(self, doc_id, document):
+        position = len(self.doc_ids)
+        tokens = tokenize(document.page_content)
+        self.doc_ids.append(doc_id)
+        self.doc_lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        for term, frequency in Counter(tokens).items():
+            self.postings[term].append((position, frequency))
+        self.documents[doc_id] = document
+
+    def attach(self, documents_by_id):
+        self.documents = {doc_id: documents_by_id[doc_id] for doc_id in self.doc_ids if doc_id in documents_by_id}
+        return self
+
+    def search(self, query, k=10):
+        """[(document, score)] for the `k` best-scoring documents, best first."""
+        if not self.doc_ids:
+            return []
+        n = len(self.doc_ids)
+        average_length = self.total_length / n or 1
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[position] / average_length)
+                scores[position] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            (self.documents[self.doc_ids[position]], score)
+            for position, score in best
+            if self.doc_ids[position] in self.documents
+        ]
+
+    def __getstate__(self):
+        state = dict(self.__dict__, postings=dict(self.postings))
+        del state["documents"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.postings = defaultdict(list, self.postings)
+        self.documents = {}
+
+
+def reciprocal_rank_fusion(result_lists, k=60, key=lambda doc: doc.metadata.get("chunk_id", doc.page_content)):
+    """Merge ranked document lists by summing 1 / (k + rank) per document, best first."""
+    scores = defaultdict(float)
+    documents = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            doc_key = key(doc)
+            scores[doc_key] += 1.0 / (k + rank + 1)
+            documents.setdefault(doc_key, doc)
+    return [documents[doc_key] for doc_key in sorted(scores, key=scores.get, reverse=True)]
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import re
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from config import MODEL_BACKEND, EMBEDDING_MODEL, LOCAL_EMBEDDING_DIM, LOCAL_LLM_LATENCY
+from lexical_index import tokenize
+
+DOCUMENT_MARKER = re.compile(r"Document \d+:\n")
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words embedder: unigrams and bigrams hashed into signed buckets.
+
+    Texts that share terms land close together, which is enough to exercise chunking, the
+    vector index and the answer cache offline. Hashes come from blake2b rather than hash(),
+    so vectors are identical across processes and runs.
+    """
+
+    def __init__(self, dim=LOCAL_EMBEDDING_DIM):
+        self.dim = dim
+
+    def _features(self, text):
+        tokens = tokenize(text)
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype="float32")
+        for feature in self._features(text):
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class LocalChatModel(BaseChatModel):
+    """Templated stand-in for ChatOpenAI that answers from the retrieved context.
+
+    The answer is the context sentences sharing the most terms with the question, so it is
+    deterministic and still depends on what retrieval returned. `latency` adds a fixed delay
+    per call to approximate a remote model when measuring throughput.
+    """
+
+    latency: float = LOCAL_LLM_LATENCY
+    max_sentences: int = 2
+
+    @property
+    def _llm_type(self):
+        return "local-template"
+
+    def _answer(self, messages):
+        question = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        prompt_text = "\n".join(m.content for m in messages if isinstance(m.content, str))
+        parts = DOCUMENT_MARKER.split(prompt_text)[1:]
+        if not parts:
+            return "I'm sorry, I don't have information about that."
+        parts[-1] = parts[-1].split("\n\nRecent history:")[0]
+        question_terms = set(tokenize(question))
+        sentences = [s.strip() for part in parts for s in SENTENCE_BOUNDARY.split(" ".join(part.split())) if s.strip()]
+        ranked = sorted(enumerate(sentences), key=lambda item: (-len(question_terms & set(tokenize(item[1]))), item[0]))
+        best = sorted(ranked[:self.max_sentences])
+        return " ".join(sentence for _, sentence in best)
+
+    def _usage(self, messages, answer):
+        # Word counts stand in for tokens, so token metrics move the way real usage would
+        input_tokens = sum(len(m.content.split()) for m in messages if isinstance(m.content, str))
+        output_tokens = len(answer.split())
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _result(self, messages):
+        answer = self._answer(messages)
+        message = AIMessage(content=answer, usage_metadata=self._usage(messages, answer))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, messages):
+        answer = self._answer(messages)
+        for word in re.findall(r"\S+\s*", answer):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, answer)))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        yield from self._chunks(messages)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            yield chunk
+
+
+class DeferredEmbeddings(Embeddings):
+    """Creates the real embedder on first use.
+
+    Importing langchain_openai takes seconds, and a process that starts from an index
+    snapshot with a warm embedding cache may not need it for a while.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._embeddings = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self._factory()
+        return self._embeddings
+
+    def embed_documents(self, texts):
+        return self._get().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self._get().embed_query(text)
+
+
+def create_embeddings(openai_api_key=None):
+    if MODEL_BACKEND == "local":
+        return HashingEmbeddings()
+
+    def create():
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(model=EMBEDDING_MODEL, openai_api_key=openai_api_key)
+    return DeferredEmbeddings(create)
+
+
+def create_chat_model():
+    if MODEL_BACKEND == "local":
+        return LocalChatModel()
+    from langchain_openai import ChatOpenAI
+    # stream_usage adds token counts to the last streamed chunk, as non-streaming calls have
+    return ChatOpenAI(stream_usage=True)
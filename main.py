@@ -1,32 +1,47 @@
+import hmac
+import json
 import logging
-import os
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query, Header, Depends
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import asyncio
 from fastapi.middleware.cors import CORSMiddleware
 
 
-from langchain_community.chat_message_histories import PostgresChatMessageHistory
 from langchain_core.runnables import RunnableWithMessageHistory
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
-from config import load_environment
-from index_manager import load_or_create_index, update_index_with_interaction, get_relevant_context
-from database_manager import (init_db, store_interaction, update_feedback, 
-                              get_conversation_history, get_all_conversations, 
-                              create_new_conversation, update_conversation_title, get_conversation, delete_conversation,
-                              get_feedback_statistics, get_low_rated_interactions, update_interaction_for_improvement,
-                              get_recent_positive_interactions)
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+from config import (load_environment, INDEX_ROLE, INDEX_POLL_INTERVAL, ADMIN_TOKEN, PROMETHEUS_MULTIPROC_DIR,
+                    METRICS_REFRESH_INTERVAL)
+from index_manager import (load_or_create_index, aretrieve_context, interaction_document_text,
+                           load_interaction_segment, load_example_store, add_example, request_ingest,
+                           run_ingest_loop, run_snapshot_watcher, snapshot_published, embeddings,
+                           index_status, start_index_build, rollback_index)
+from answer_cache import answer_cache, context_fingerprint
+from example_store import example_store
+from chat_history_utils import CachedChatMessageHistory
+from improvement_worker import ImprovementWorker
+from local_models import create_chat_model
+from observability import (stage_timer, stage_timings, configure_logging, log_payload, record_llm_usage,
+                           refresh_gauges, metrics_payload, mark_process_dead, RequestContextMiddleware)
+from prometheus_client import CONTENT_TYPE_LATEST
+from history_cache import history_cache
+from notifications import NotificationListener, INSTANCE_ID, INVALIDATE_CHANNEL, INDEX_CHANNEL
+from database_manager import (init_db, update_feedback, 
+                              get_conversation_history_page, get_conversations_page, 
+                              create_new_conversation, delete_conversation,
+                              get_feedback_totals, get_daily_feedback_statistics,
+                              begin_turn, finish_turn, get_interaction, get_pool_stats, open_pool, run_db,
+                              DATABASE_URL, SESSION_SETUP)
+
+# Set up logging; log lines carry the request and span ids
+configure_logging()
 logger = logging.getLogger(__name__)
 
-from config import load_environment
-
 try:
     load_environment()
 except ValueError as e:
@@ -44,16 +59,15 @@ app.add_middleware(
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
 )
+app.add_middleware(RequestContextMiddleware)
 
-# Load environment variables and initialize database
-load_environment()
-init_db()
+# The database, index and model are loaded by warm_up after the server starts, so importing
+# this module is fast and /healthz answers while the index loads
+model = None
+chain_with_history = None
 
-# Load or create vector index
-vectorstore = load_or_create_index()
-
-# Initialize the language model
-model = ChatOpenAI()
+# Warm-up progress reported by /readyz; questions are refused until it is "ready"
+warmup = {"state": "starting", "started_at": None, "ready_at": None, "steps": {}, "error": None}
 
 # Create the prompt template
 prompt = ChatPromptTemplate.from_messages([
@@ -75,20 +89,21 @@ prompt = ChatPromptTemplate.from_messages([
     ("system", "Relevant DMU context: {context}")
 ])
 
-# Create the chain
-chain = prompt | model
-
-# Wrap the chain with message history
-chain_with_history = RunnableWithMessageHistory(
-    chain,
-    lambda session_id: PostgresChatMessageHistory(
-        session_id=session_id, 
-        connection_string=os.environ.get('DATABASE_URL'),
-        table_name="Chat_history"
-    ),
-    input_messages_key="question",
-    history_messages_key="history",
-)
+def get_session_history(session_id):
+    # Reads come from the conversation history cache that retrieval already populated this turn
+    return CachedChatMessageHistory(session_id=session_id)
+
+def build_chain():
+    global model, chain_with_history
+    # Initialize the language model
+    model = create_chat_model()
+    # Create the chain and wrap it with message history
+    chain_with_history = RunnableWithMessageHistory(
+        prompt | model,
+        get_session_history,
+        input_messages_key="question",
+        history_messages_key="history",
+    )
 
 # Pydantic models
 class Question(BaseModel):
@@ -108,47 +123,96 @@ class Conversation(BaseModel):
     id: str
     title: str
     messages: List[Message]
+    next_cursor: Optional[str] = None
 
 class ChatHistory(BaseModel):
     conversations: List[Conversation]
+    next_cursor: Optional[str] = None
 
-@app.post("/ask")
-async def ask_question(question: Question, background_tasks: BackgroundTasks):
-    logger.info(f"Received question: {question.question}")
+async def prepare_question(question: Question):
+    """Make sure the conversation exists and assemble the context for the question.
+
+    Returns the retrieval result and the full context string passed to the model.
+    """
+    if not question.conversation_id:
+        question.conversation_id = str(uuid.uuid4())
+        logger.debug(f"Created new conversation with ID: {question.conversation_id}")
+
+    # Conversation upsert and history in one round-trip
+    with stage_timer("db"):
+        conversation_history = await run_db(begin_turn, question.conversation_id, question.question[:30])
+
+    retrieval = await aretrieve_context(question.question, conversation_history, question.conversation_id)
+    relevant_context = retrieval.context
+
+    log_payload(logger, "Retrieved relevant context", relevant_context)
+    return retrieval, relevant_context
+
+def lookup_cached_answer(retrieval):
+    # Only standalone questions are cached; follow-ups depend on the conversation so far
+    if retrieval.history or retrieval.query_vector is None:
+        return None
+    return answer_cache.lookup(retrieval.query_vector, context_fingerprint(retrieval.index_version, retrieval.docs))
+
+def cache_answer(question: Question, retrieval, answer: str, interaction_id: int):
+    if retrieval.history or retrieval.query_vector is None:
+        return
+    answer_cache.store(question.question, retrieval.query_vector,
+                       context_fingerprint(retrieval.index_version, retrieval.docs), answer, interaction_id)
+
+async def persist_answer(question: Question, retrieval, answer: str):
+    # The turn is queued for indexing in the same transaction and picked up by the ingest loop
+    index_content = interaction_document_text(question.question, answer, question.conversation_id, retrieval.history)
+    with stage_timer("persist"):
+        interaction_id = await run_db(
+            finish_turn, question.conversation_id, question.question, answer, "default", question.question[:30],
+            index_content
+        )
+    request_ingest()
+    return interaction_id
+
+async def persist_cached_answer(question: Question, cached):
+    interaction_id = await run_db(
+        finish_turn, question.conversation_id, question.question, cached["answer"], "cached", question.question[:30]
+    )
+    answer_cache.link(interaction_id, cached)
+    return interaction_id
+
+def require_ready():
+    if warmup["state"] != "ready":
+        raise HTTPException(status_code=503, detail="The service is starting up", headers={"Retry-After": "5"})
+
+@app.post("/ask", dependencies=[Depends(require_ready)])
+async def ask_question(question: Question):
+    log_payload(logger, "Received question", question.question)
     
     try:
-        if not question.conversation_id:
-            question.conversation_id = str(uuid.uuid4())
-            create_new_conversation(question.conversation_id, question.question[:30])
-            logger.info(f"Created new conversation with ID: {question.conversation_id}")
-        else:
-            conversation = get_conversation(question.conversation_id)
-            if not conversation:
-                create_new_conversation(question.conversation_id, question.question[:30])
-                logger.info(f"Created new conversation with ID: {question.conversation_id}")
-
-        relevant_context = get_relevant_context(question.question, question.conversation_id)
-        
-        # Include recent positive interactions in the context
-        positive_interactions = get_recent_positive_interactions(limit=5)
-        for q, a in positive_interactions:
-            relevant_context += f"\nQ: {q}\nA: {a}\n"
-        
-        logger.info(f"Retrieved relevant context: {relevant_context[:500]}...")
+        retrieval, relevant_context = await prepare_question(question)
+
+        cached = lookup_cached_answer(retrieval)
+        if cached:
+            logger.debug("Serving answer from the semantic cache.")
+            interaction_id = await persist_cached_answer(question, cached)
+            return {
+                "interaction_id": interaction_id,
+                "conversation_id": question.conversation_id,
+                "answer": cached["answer"],
+            }
 
         config = {"configurable": {"session_id": question.conversation_id}}
         
-        result = chain_with_history.invoke(
-            {"question": question.question, "context": relevant_context},
-            config=config
-        )
+        with stage_timer("generate"):
+            result = await chain_with_history.ainvoke(
+                {"question": question.question, "context": relevant_context},
+                config=config
+            )
+        record_llm_usage(result)
 
         answer = result.content
-        logger.info(f"Generated answer: {answer[:500]}...")
+        log_payload(logger, "Generated answer", answer)
 
-        interaction_id = store_interaction(question.conversation_id, question.question, answer, "default")
-        update_conversation_title(question.conversation_id, question.question[:30])
-        background_tasks.add_task(update_index_with_interaction, question.question, answer, question.conversation_id)
+        interaction_id = await persist_answer(question, retrieval, answer)
+        cache_answer(question, retrieval, answer, interaction_id)
 
         return {
             "interaction_id": interaction_id,
@@ -159,88 +223,350 @@ async def ask_question(question: Question, background_tasks: BackgroundTasks):
         logger.error(f"Error processing question: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An error occurred while processing your question: {str(e)}")
 
+@app.post("/ask/stream", dependencies=[Depends(require_ready)])
+async def ask_question_stream(question: Question):
+    """Stream the answer as newline-delimited JSON events.
+
+    Emits a "start" event with the conversation id, a "token" event per generated chunk,
+    and a final "done" event with the interaction id once the answer has been stored.
+    """
+    log_payload(logger, "Received streaming question", question.question)
+
+    try:
+        retrieval, relevant_context = await prepare_question(question)
+    except Exception as e:
+        logger.error(f"Error processing question: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"An error occurred while processing your question: {str(e)}")
+
+    async def event_stream():
+        yield json.dumps({"type": "start", "conversation_id": question.conversation_id}) + "\n"
+        try:
+            cached = lookup_cached_answer(retrieval)
+            if cached:
+                logger.debug("Serving answer from the semantic cache.")
+                yield json.dumps({"type": "token", "content": cached["answer"]}) + "\n"
+                interaction_id = await persist_cached_answer(question, cached)
+                yield json.dumps({
+                    "type": "done",
+                    "interaction_id": interaction_id,
+                    "conversation_id": question.conversation_id,
+                    "answer": cached["answer"],
+                }) + "\n"
+                return
+
+            config = {"configurable": {"session_id": question.conversation_id}}
+            parts = []
+            # Includes the time the client takes to read each token
+            with stage_timer("generate"):
+                async for chunk in chain_with_history.astream(
+                    {"question": question.question, "context": relevant_context},
+                    config=config
+                ):
+                    record_llm_usage(chunk)
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield json.dumps({"type": "token", "content": chunk.content}) + "\n"
+
+            answer = "".join(parts)
+            log_payload(logger, "Generated answer", answer)
+
+            # Saved before the final event so the client gets the interaction id to rate the answer
+            interaction_id = await persist_answer(question, retrieval, answer)
+            cache_answer(question, retrieval, answer, interaction_id)
+            yield json.dumps({
+                "type": "done",
+                "interaction_id": interaction_id,
+                "conversation_id": question.conversation_id,
+                "answer": answer,
+            }) + "\n"
+        except Exception as e:
+            logger.error(f"Error streaming answer: {str(e)}", exc_info=True)
+            yield json.dumps({"type": "error", "detail": f"An error occurred while processing your question: {str(e)}"}) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
 @app.post("/feedback")
 async def submit_feedback(feedback: Feedback):
     try:
         feedback_value = 1 if feedback.is_helpful else 0
-        update_feedback(feedback.interaction_id, feedback_value)
+        interaction = await run_db(update_feedback, feedback.interaction_id, feedback_value)
+        if not feedback.is_helpful:
+            answer_cache.invalidate_interaction(feedback.interaction_id)
+            example_store.remove(feedback.interaction_id)
+        elif interaction:
+            await asyncio.to_thread(add_example, feedback.interaction_id, *interaction)
         return {"message": "Feedback received"}
     except Exception as e:
         logger.error(f"Error submitting feedback: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An error occurred while submitting feedback: {str(e)}")
 
 @app.get("/chat_history")
-async def get_chat_history_endpoint():
-    conversations = get_all_conversations()
-    return ChatHistory(conversations=[Conversation(id=id, title=title, messages=[]) for id, title in conversations])
+async def get_chat_history_endpoint(limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None):
+    try:
+        conversations, next_cursor = await run_db(get_conversations_page, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ChatHistory(
+        conversations=[Conversation(id=id, title=title, messages=[]) for id, title in conversations],
+        next_cursor=next_cursor,
+    )
 
 @app.get("/conversation/{conversation_id}")
-async def get_conversation_endpoint(conversation_id: str):
-    history = get_conversation_history(conversation_id)
+async def get_conversation_endpoint(conversation_id: str, limit: int = Query(100, ge=1, le=500), cursor: Optional[str] = None):
+    try:
+        history, next_cursor = await run_db(get_conversation_history_page, conversation_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     messages = []
-    for question, answer, timestamp in history:
+    for _, question, answer, timestamp in history:
         messages.append(Message(sender="Human", content=question, timestamp=str(timestamp)))
         messages.append(Message(sender="AI", content=answer, timestamp=str(timestamp)))
-    return Conversation(id=conversation_id, title=f"Conversation {conversation_id[:8]}", messages=messages)
+    return Conversation(id=conversation_id, title=f"Conversation {conversation_id[:8]}", messages=messages, next_cursor=next_cursor)
 
 @app.post("/conversation/new")
 async def create_new_conversation_endpoint():
     conversation_id = str(uuid.uuid4())
     title = f"New Conversation {conversation_id[:8]}"
-    create_new_conversation(conversation_id, title)
+    await run_db(create_new_conversation, conversation_id, title)
     return {"conversation_id": conversation_id, "title": title}
 
 @app.delete("/conversation/{conversation_id}")
 async def delete_conversation_endpoint(conversation_id: str):
     try:
-        delete_conversation(conversation_id)
+        await run_db(delete_conversation, conversation_id)
+        example_store.remove_conversation(conversation_id)
         return {"message": "Conversation deleted"}
     except Exception as e:
         logger.error(f"Error deleting conversation: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An error occurred while deleting the conversation: {str(e)}")
 
+@app.get("/stats")
+async def stats_endpoint(days: int = Query(30, ge=1, le=366)):
+    (interactions, helpful, not_helpful), daily = await asyncio.gather(
+        run_db(get_feedback_totals), run_db(get_daily_feedback_statistics, days)
+    )
+    rated = helpful + not_helpful
+    return {
+        "interactions": interactions,
+        "helpful": helpful,
+        "not_helpful": not_helpful,
+        "helpful_ratio": helpful / rated if rated else None,
+        "not_helpful_ratio": not_helpful / rated if rated else None,
+        "daily": [
+            {"day": str(day), "interactions": count, "helpful": day_helpful, "not_helpful": day_not_helpful}
+            for day, count, day_helpful, day_not_helpful in daily
+        ],
+    }
+
+@app.get("/pool_stats")
+async def pool_stats_endpoint():
+    return get_pool_stats()
+
+@app.get("/stage_stats")
+async def stage_stats_endpoint():
+    return stage_timings.snapshot()
+
+def refresh_app_gauges():
+    refresh_gauges(get_pool_stats(), {
+        "answer": answer_cache.stats(),
+        "embedding": embeddings.stats(),
+        "history": history_cache.stats(),
+        "example": example_store.stats(),
+    })
+
+async def run_gauge_refresher(interval=METRICS_REFRESH_INTERVAL):
+    # A scrape only reaches one worker, so each worker keeps its own gauges current
+    while True:
+        refresh_app_gauges()
+        await asyncio.sleep(interval)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    refresh_app_gauges()
+    return Response(metrics_payload(), media_type=CONTENT_TYPE_LATEST)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # The admin endpoints are disabled unless ADMIN_TOKEN is configured
+    if not ADMIN_TOKEN or not hmac.compare_digest((x_admin_token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def require_index_writer():
+    if INDEX_ROLE == "worker":
+        raise HTTPException(status_code=409, detail="In worker mode the index is managed by index_builder.py; "
+                                                    "use its --rollback and --rebuild options")
+
+@app.get("/admin/index", dependencies=[Depends(require_admin)])
+async def index_status_endpoint():
+    return await asyncio.to_thread(index_status)
+
+@app.post("/admin/index/rebuild", status_code=202, dependencies=[Depends(require_admin), Depends(require_index_writer)])
+async def rebuild_index_endpoint(full: bool = False, force: bool = False):
+    """Start a background sync (or full rebuild) of the corpus index; poll GET /admin/index for the outcome.
+
+    After a rollback the index is pinned, and only a build with `force` replaces it.
+    """
+    if not start_index_build(full, force):
+        raise HTTPException(status_code=409, detail="An index build is already running")
+    return {"message": "Index build started"}
+
+@app.post("/admin/index/rollback", dependencies=[Depends(require_admin), Depends(require_index_writer)])
+async def rollback_index_endpoint(version: Optional[str] = None):
+    try:
+        version = await asyncio.to_thread(rollback_index, version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Index rolled back", "version": version}
+
 @app.get("/")
 async def root():
     return {"message": "API is running"}
 
-async def periodic_feedback_analysis():
-    while True:
-        try:
-            stats = get_feedback_statistics()
-            if stats:
-                positive_ratio, negative_ratio, avg_feedback = stats
-                logger.info(f"Feedback stats: Positive: {positive_ratio:.2f}, Negative: {negative_ratio:.2f}, Average: {avg_feedback:.2f}")
-                
-                if negative_ratio > 0.3:  # If more than 30% feedback is negative
-                    low_rated = get_low_rated_interactions()
-                    for interaction_id, question, answer, feedback in low_rated:
-                        improved_answer = await improve_answer(question, answer)
-                        update_interaction_for_improvement(interaction_id, improved_answer)
-                        logger.info(f"Improved answer for question: {question}")
-            
-            await asyncio.sleep(3600)  # Run every hour
-        except Exception as e:
-            logger.error(f"Error in periodic feedback analysis: {str(e)}")
-            await asyncio.sleep(3600)  # Wait an hour before retrying
+@app.get("/healthz")
+async def healthz():
+    # Liveness: the server is up; only a failed warm-up needs a restart
+    if warmup["state"] == "failed":
+        return JSONResponse(status_code=503, content={"status": "failed", "error": warmup["error"]})
+    return {"status": "ok", "state": warmup["state"]}
+
+@app.get("/readyz")
+async def readyz():
+    # Readiness: the index, caches and model are loaded
+    return JSONResponse(status_code=200 if warmup["state"] == "ready" else 503, content=warmup)
 
 async def improve_answer(question, previous_answer):
-    context = get_relevant_context(question)
+    # Improvement is not tied to a conversation, so retrieve on the question alone
+    retrieval = await aretrieve_context(question, [])
     prompt = f"""
     The following question received a low rating:
     Question: {question}
     Previous Answer: {previous_answer}
     
     Please provide an improved answer based on the following context:
-    {context}
+    {retrieval.context}
     
     Improved Answer:
     """
-    response = await model.agenerate([prompt])
-    return response.generations[0][0].text
+    response = await model.ainvoke(prompt)
+    record_llm_usage(response)
+    return response.content
+
+improvement_worker = ImprovementWorker(improve_answer)
+
+@app.get("/improvement_stats")
+async def improvement_stats_endpoint():
+    return await improvement_worker.astats()
+
+# Example refreshes read the database and embed the question, so they run here rather than on
+# the notification listener thread; a single thread applies them in notification order
+example_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="examples")
+
+def run_example_task(func, *args):
+    try:
+        func(*args)
+    except Exception as e:
+        logger.error(f"Error updating the example store: {e}")
+
+def refresh_example(interaction_id):
+    interaction = get_interaction(interaction_id)
+    if interaction and interaction[3] == 1:
+        add_example(interaction_id, *interaction[:3])
+
+def apply_interaction_change(change):
+    """Bring this worker's caches in line with an interaction written by another process.
+
+    Runs on the notification listener thread, which only invalidates caches; the caches are all
+    thread-safe.
+    """
+    if change.get("origin") == INSTANCE_ID:
+        return
+    op = change.get("op")
+    interaction_id = change.get("interaction_id")
+    if op in ("INSERT", "DELETE") or change.get("answer_changed"):
+        history_cache.invalidate(change.get("conversation_id"))
+    if op == "INSERT":
+        return
+    if op == "UPDATE" and change.get("feedback") == 1 and not change.get("answer_changed"):
+        example_executor.submit(run_example_task, refresh_example, interaction_id)
+        return
+    example_executor.submit(run_example_task, example_store.remove, interaction_id)
+    if op == "DELETE" or change.get("feedback") == 0 or change.get("answer_changed"):
+        answer_cache.invalidate_interaction(interaction_id)
+
+def resync_caches():
+    # Notifications sent while the listener was disconnected are lost, so start the caches over
+    history_cache.clear()
+    answer_cache.clear()
+    example_executor.submit(run_example_task, load_example_store)
+
+def start_notification_listener(loop):
+    return NotificationListener(
+        DATABASE_URL,
+        {
+            INVALIDATE_CHANNEL: apply_interaction_change,
+            INDEX_CHANNEL: lambda _: loop.call_soon_threadsafe(snapshot_published.set),
+        },
+        on_reconnect=resync_caches,
+        session_setup=SESSION_SETUP,
+    ).start()
+
+def init_database():
+    open_pool()
+    init_db()
+
+def load_index():
+    # Workers wait for the index builder's first snapshot rather than building one
+    while load_or_create_index() is None:
+        if INDEX_ROLE != "worker":
+            raise RuntimeError("No index could be loaded or built")
+        time.sleep(INDEX_POLL_INTERVAL)
+
+WARMUP_STEPS = [
+    ("database", init_database),
+    ("index", load_index),
+    ("interactions", load_interaction_segment),
+    ("examples", load_example_store),
+    ("model", build_chain),
+]
+
+async def warm_up():
+    """Run each warm-up step off the event loop, recording its duration; returns whether all succeeded."""
+    warmup.update(state="warming", started_at=time.time())
+    for name, step in WARMUP_STEPS:
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(step)
+        except Exception as e:
+            logger.error(f"Warm-up step {name} failed: {e}", exc_info=True)
+            warmup.update(state="failed", error=f"{name}: {e}")
+            return False
+        warmup["steps"][name] = round(time.perf_counter() - start, 3)
+    warmup.update(state="ready", ready_at=time.time())
+    logger.info(f"Ready after {warmup['ready_at'] - warmup['started_at']:.2f}s: {warmup['steps']}")
+    return True
+
+def start_background_tasks():
+    asyncio.create_task(improvement_worker.run_forever())
+    if PROMETHEUS_MULTIPROC_DIR:
+        asyncio.create_task(run_gauge_refresher())
+    if INDEX_ROLE == "worker":
+        # The index builder indexes interactions and publishes snapshots; other workers write too
+        start_notification_listener(asyncio.get_running_loop())
+        asyncio.create_task(run_snapshot_watcher())
+    else:
+        asyncio.create_task(run_ingest_loop())
+
+async def start_app():
+    if await warm_up():
+        start_background_tasks()
 
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(periodic_feedback_analysis())
+    # Warm up in the background, so the server accepts connections and answers /healthz at once
+    app.state.warmup_task = asyncio.create_task(start_app())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    mark_process_dead()
 
 if __name__ == "__main__":
     import uvicorn
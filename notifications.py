@@ -0,0 +1,90 @@
+import json
+import logging
+import os
+import select
+import socket
+import threading
+
+import psycopg2
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process's database sessions (as their application_name), so it can skip
+# the notifications its own writes caused
+INSTANCE_ID = f"dmu:{socket.gethostname()}:{os.getpid()}"[:63]
+
+# Sent by a trigger on interactions: a turn was added, rated, improved or deleted
+INVALIDATE_CHANNEL = "dmu_invalidate"
+# Sent by a trigger on index_ingest_queue: interactions are waiting to be indexed
+INGEST_CHANNEL = "dmu_ingest"
+# Sent by the index builder after publishing a snapshot
+INDEX_CHANNEL = "dmu_index"
+
+
+class NotificationListener:
+    """LISTENs on a dedicated connection in a background thread.
+
+    `handlers` maps each channel to a function called with the decoded JSON payload (or {}
+    for an empty one), on the listener thread. Notifications sent while the connection is
+    down are lost, so after reconnecting `on_reconnect` is called to resynchronize.
+    """
+
+    def __init__(self, dsn, handlers, on_reconnect=None, session_setup=(), retry_interval=5.0):
+        self.dsn = dsn
+        self.handlers = handlers
+        self.on_reconnect = on_reconnect
+        self.session_setup = list(session_setup)
+        self.retry_interval = retry_interval
+        self._stopped = threading.Event()
+        self._thread = None
+        self.received = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="notification-listener", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _listen(self):
+        conn = psycopg2.connect(self.dsn, application_name=f"{INSTANCE_ID}:listener"[:63])
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            for statement in self.session_setup:
+                cur.execute(statement)
+            for channel in self.handlers:
+                cur.execute(f"LISTEN {channel}")
+        return conn
+
+    def _dispatch(self, notification):
+        self.received += 1
+        try:
+            payload = json.loads(notification.payload) if notification.payload else {}
+            self.handlers[notification.channel](payload)
+        except Exception as e:
+            logger.error(f"Error handling {notification.channel} notification: {e}")
+
+    def _run(self):
+        connected_before = False
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = self._listen()
+                logger.info(f"Listening for {', '.join(self.handlers)} notifications.")
+                if connected_before and self.on_reconnect:
+                    self.on_reconnect()
+                connected_before = True
+                while not self._stopped.is_set():
+                    if select.select([conn], [], [], self.retry_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._dispatch(conn.notifies.pop(0))
+            except Exception as e:
+                logger.warning(f"Notification listener disconnected ({e}); reconnecting in {self.retry_interval}s.")
+                self._stopped.wait(self.retry_interval)
+            finally:
+                if conn is not None:
+                    conn.close()
@@ -0,0 +1,215 @@
+import contextvars
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+from config import LOG_LEVEL, LOG_PAYLOAD_SAMPLE_RATE, PROMETHEUS_MULTIPROC_DIR
+
+# Stages of a request, in pipeline order, then background indexing
+STAGES = ("db", "embed", "search", "generate", "persist", "index")
+
+STAGE_SECONDS = Histogram(
+    "dmu_stage_seconds", "Time spent in each stage of answering a question", ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+REQUEST_SECONDS = Histogram("dmu_request_seconds", "HTTP request latency", ["method", "route", "status"])
+LLM_TOKENS = Counter("dmu_llm_tokens_total", "Tokens used by LLM calls", ["kind"])
+# With PROMETHEUS_MULTIPROC_DIR, counts are summed over the live workers, and ratios are reported per
+# worker (a pid label)
+DB_POOL_CONNECTIONS = Gauge("dmu_db_pool_connections", "Database pool connections by state", ["state"],
+                            multiprocess_mode="livesum")
+DB_POOL_SATURATION = Gauge("dmu_db_pool_saturation", "Share of the database pool in use or waited for",
+                           multiprocess_mode="liveall")
+CACHE_ENTRIES = Gauge("dmu_cache_entries", "Entries held by each in-process cache", ["cache"],
+                      multiprocess_mode="livesum")
+CACHE_HIT_RATE = Gauge("dmu_cache_hit_rate", "Lifetime hit rate of each in-process cache", ["cache"],
+                       multiprocess_mode="liveall")
+
+# Request and span ids for log lines; asyncio tasks and run_db calls inherit them
+request_id_var = contextvars.ContextVar("request_id", default="-")
+span_id_var = contextvars.ContextVar("span_id", default="-")
+payload_sampled_var = contextvars.ContextVar("payload_sampled", default=None)
+
+
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+def new_id():
+    return uuid.uuid4().hex[:16]
+
+
+_default_record_factory = logging.getLogRecordFactory()
+
+
+def _record_factory(*args, **kwargs):
+    record = _default_record_factory(*args, **kwargs)
+    record.request_id = request_id_var.get()
+    record.span_id = span_id_var.get()
+    return record
+
+
+logging.setLogRecordFactory(_record_factory)
+
+
+def configure_logging():
+    logging.basicConfig(
+        level=LOG_LEVEL, format="%(levelname)s:%(name)s:[%(request_id)s/%(span_id)s] %(message)s", force=True
+    )
+
+
+def start_request(request_id=None):
+    """Bind a request id to the current context and decide whether its payloads are logged."""
+    if not request_id or not REQUEST_ID_PATTERN.fullmatch(request_id):
+        request_id = new_id()
+    request_id_var.set(request_id)
+    span_id_var.set(new_id())
+    payload_sampled_var.set(random.random() < LOG_PAYLOAD_SAMPLE_RATE)
+    return request_id
+
+
+class RequestContextMiddleware:
+    """ASGI middleware that starts a request context and records request latency by route.
+
+    The id comes from the X-Request-ID header when it looks like one, and is echoed back in
+    the response so clients can find their request in the logs.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        request_id = start_request(header)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
+
+
+def log_payload(logger, message, payload, limit=500):
+    # Costs one level check unless DEBUG is on and this request was sampled
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    sampled = payload_sampled_var.get()
+    if sampled is None:
+        sampled = random.random() < LOG_PAYLOAD_SAMPLE_RATE
+    if sampled:
+        logger.debug(f"{message}: {payload[:limit]}")
+
+
+class StageTimings:
+    """Per-stage latency counters with percentiles over the most recent `sample_size` calls."""
+
+    def __init__(self, sample_size=2000):
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, stage, seconds):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {"count": 0, "total": 0.0, "max": 0.0,
+                                               "samples": deque(maxlen=self.sample_size)}
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["samples"].append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            stages = {stage: dict(entry, samples=sorted(entry["samples"])) for stage, entry in self._stages.items()}
+        result = {}
+        for stage, entry in stages.items():
+            samples = entry["samples"]
+            result[stage] = {
+                "count": entry["count"],
+                "mean_ms": entry["total"] / entry["count"] * 1000,
+                "p50_ms": samples[int(len(samples) * 0.50)] * 1000,
+                "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+                "max_ms": entry["max"] * 1000,
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+stage_timings = StageTimings()
+
+
+def observe_stage(stage, seconds):
+    stage_timings.record(stage, seconds)
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage):
+    """Time a stage and run it in its own span, so its log lines carry the span id."""
+    # Wall-clock time, so waiting on the pool or the event loop counts towards the stage
+    parent = span_id_var.get()
+    span_id_var.set(new_id())
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+        span_id_var.set(parent)
+
+
+def record_llm_usage(message):
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        LLM_TOKENS.labels("prompt").inc(usage.get("input_tokens", 0))
+        LLM_TOKENS.labels("completion").inc(usage.get("output_tokens", 0))
+
+
+def refresh_gauges(pool_stats, cache_stats):
+    """Copy point-in-time pool and cache stats into gauges; called when /metrics is scraped, and
+    periodically by every worker when metrics are collected across processes."""
+    for state in ("size", "idle", "in_use", "waiting"):
+        DB_POOL_CONNECTIONS.labels(state).set(pool_stats[state])
+    DB_POOL_SATURATION.set(pool_stats["saturation"])
+    for cache, stats in cache_stats.items():
+        CACHE_ENTRIES.labels(cache).set(stats.get("entries", stats.get("conversations", 0)))
+        lookups = stats.get("hits", 0) + stats.get("misses", 0)
+        hit_rate = stats.get("hit_rate", stats.get("hits", 0) / lookups if lookups else 0.0)
+        CACHE_HIT_RATE.labels(cache).set(hit_rate)
+
+
+def metrics_payload():
+    """The /metrics body; with PROMETHEUS_MULTIPROC_DIR it covers every worker process."""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_process_dead():
+    # Drops this worker's live gauges; its counters and histograms still count towards the totals
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
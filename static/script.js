@@ -23,19 +23,25 @@ function autoResizeTextarea() {
     this.style.height = (this.scrollHeight) + 'px';
 }
 
-async function loadChatHistory() {
+async function loadChatHistory(cursor = null) {
     try {
-        const response = await fetch('/chat_history');
+        const url = cursor ? `/chat_history?cursor=${encodeURIComponent(cursor)}` : '/chat_history';
+        const response = await fetch(url);
         const data = await response.json();
-        updateChatHistoryList(data.conversations);
+        updateChatHistoryList(data.conversations, data.next_cursor, cursor !== null);
     } catch (error) {
         console.error('Error loading chat history:', error);
     }
 }
 
-function updateChatHistoryList(conversations) {
+function updateChatHistoryList(conversations, nextCursor = null, append = false) {
     const chatHistoryList = document.getElementById('chat-history-list');
-    chatHistoryList.innerHTML = '';
+    if (append) {
+        const loadMore = chatHistoryList.querySelector('.load-more-button');
+        if (loadMore) loadMore.remove();
+    } else {
+        chatHistoryList.innerHTML = '';
+    }
 
     conversations.forEach(conversation => {
         const item = document.createElement('div');
@@ -60,18 +66,36 @@ function updateChatHistoryList(conversations) {
         item.addEventListener('click', () => loadChat(conversation.id));
         chatHistoryList.appendChild(item);
     });
+
+    if (nextCursor) {
+        const loadMore = document.createElement('button');
+        loadMore.className = 'load-more-button w-full p-2 text-gray-300 hover:text-white';
+        loadMore.textContent = 'Load more';
+        loadMore.addEventListener('click', () => loadChatHistory(nextCursor));
+        chatHistoryList.appendChild(loadMore);
+    }
 }
 
 async function loadChat(conversationId) {
     currentConversationId = conversationId;
     try {
-        const response = await fetch(`/conversation/${conversationId}`);
-        const data = await response.json();
+        // The conversation is paged; follow the cursors until every message is loaded
+        let messages = [];
+        let cursor = null;
+        do {
+            const url = cursor
+                ? `/conversation/${conversationId}?cursor=${encodeURIComponent(cursor)}`
+                : `/conversation/${conversationId}`;
+            const response = await fetch(url);
+            const data = await response.json();
+            messages = messages.concat(data.messages);
+            cursor = data.next_cursor;
+        } while (cursor);
         clearChatContainer();
-        data.messages.forEach(msg => {
+        messages.forEach(msg => {
             displayMessage(msg.content, msg.sender === 'Human' ? 'user' : 'bot', msg.interaction_id);
         });
-        questionCounter = data.messages.filter(msg => msg.sender === 'Human').length;
+        questionCounter = messages.filter(msg => msg.sender === 'Human').length;
     } catch (error) {
         console.error('Error loading chat:', error);
     }
@@ -106,7 +130,7 @@ async function sendMessage() {
         questionCounter++;
 
         try {
-            const response = await fetch('/ask', {
+            const response = await fetch('/ask/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
@@ -114,15 +138,42 @@ async function sendMessage() {
                     conversation_id: currentConversationId
                 }),
             });
-            const data = await response.json();
-            if (data.answer) {
-                displayMessage(data.answer, 'bot', data.interaction_id);
+            if (!response.ok || !response.body) {
+                throw new Error(`Request failed with status ${response.status}`);
+            }
+
+            let botMessage = null;
+            let answer = '';
+            let done = null;
+            await readEventStream(response, event => {
+                if (event.type === 'start') {
+                    currentConversationId = event.conversation_id;
+                } else if (event.type === 'token') {
+                    answer += event.content;
+                    if (!botMessage) {
+                        botMessage = displayMessage(answer, 'bot');
+                    } else {
+                        updateMessageContent(botMessage, answer);
+                    }
+                } else if (event.type === 'done') {
+                    done = event;
+                } else if (event.type === 'error') {
+                    console.error('Error:', event.detail);
+                }
+            });
+
+            if (done && done.answer) {
+                if (!botMessage) {
+                    botMessage = displayMessage(done.answer, 'bot');
+                } else {
+                    updateMessageContent(botMessage, done.answer);
+                }
+                botMessage.appendChild(createFeedbackButtons(done.interaction_id));
                 checkQuestionLimit();
             } else {
                 console.error('No answer in response');
                 displayMessage('Sorry, I couldn\'t generate an answer.', 'bot');
             }
-            currentConversationId = data.conversation_id;
             loadChatHistory();
         } catch (error) {
             console.error('Error:', error);
@@ -131,6 +182,30 @@ async function sendMessage() {
     }
 }
 
+async function readEventStream(response, onEvent) {
+    // The answer arrives as newline-delimited JSON events; a read may end mid-line
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+    }
+    if (buffer.trim()) {
+        onEvent(JSON.parse(buffer));
+    }
+}
+
+function updateMessageContent(messageElement, message) {
+    messageElement.querySelector('.message-content').innerHTML = formatMessage(message);
+    const chatContainer = document.getElementById('chat-container');
+    chatContainer.scrollTop = chatContainer.scrollHeight;
+}
+
 function checkQuestionLimit() {
     if (questionCounter >= 7) {
         const message = "You've asked 7 questions in this conversation. Would you like to start a new chat for better context management?";
@@ -207,6 +282,7 @@ function displayMessage(message, sender, interactionId = null) {
     
     chatContainer.appendChild(messageElement);
     chatContainer.scrollTop = chatContainer.scrollHeight;
+    return messageElement;
 }
 
 function formatMessage(message) {
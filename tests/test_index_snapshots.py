@@ -0,0 +1,88 @@
+import os
+import random
+import tempfile
+
+# Settings are read when the app modules are imported. Nothing here touches the database:
+# the pool only connects on first use and the embedding cache stays in memory.
+_root = tempfile.mkdtemp(prefix="dmu-test-index-")
+os.environ.update({
+    "MODEL_BACKEND": "local",
+    "DATABASE_URL": os.environ.get("DATABASE_URL", "postgresql://localhost/unused"),
+    "EMBEDDING_CACHE_PERSIST": "false",
+    "INDEX_TYPE": "ivf",
+    "INDEX_MMAP": "true",
+    "INDEX_DIR": os.path.join(_root, "index"),
+    "UPLOAD_DIR": os.path.join(_root, "upload"),
+    "INDEX_PROBE_QUERIES": "",
+    "INGEST_BATCH_SIZE": "50",
+})
+os.makedirs(os.environ["UPLOAD_DIR"])
+
+import faiss
+from langchain_core.documents import Document
+
+import index_manager
+
+
+def make_documents(n, source="removed.pdf"):
+    rng = random.Random(0)
+    words = [f"term{i}" for i in range(500)]
+    return {
+        f"{source}-{i}": Document(page_content=" ".join(rng.choice(words) for _ in range(30)),
+                                  metadata={"source": source, "chunk_id": f"{source}-{i}"})
+        for i in range(n)
+    }
+
+
+def test_sync_after_loading_memory_mapped_ivf_snapshot():
+    documents = make_documents(200)
+    store = index_manager.rebuild_store(documents)
+    assert faiss.try_extract_index_ivf(store.index) is not None
+    # The upload directory is empty, so the next sync removes the file's chunks from a clone
+    sources = {"removed.pdf": {"sha256": "0" * 64, "chunk_ids": list(documents)[:10]}}
+    index_manager.publish_snapshot(store, index_manager.build_manifest(sources))
+
+    index_manager.vectorstore = index_manager.load_valid_snapshot()
+    assert index_manager.vectorstore is not None
+    synced = index_manager.apply_upload_changes()
+
+    assert synced.index.ntotal == 190
+    assert faiss.try_extract_index_ivf(synced.index) is not None
+    assert index_manager.load_valid_snapshot().index.ntotal == 190
+
+
+def test_build_leaves_out_files_that_fail_to_parse(monkeypatch):
+    def fake_chunks(path, executor):
+        yield from make_documents(200, path).values()
+        if path == "broken.pdf":
+            raise ValueError("truncated file")
+
+    monkeypatch.setattr(index_manager, "scan_upload_dir", lambda: ["good.pdf", "broken.pdf"])
+    monkeypatch.setattr(index_manager, "file_fingerprint", lambda path: "0" * 64)
+    monkeypatch.setattr(index_manager, "iter_file_chunks", fake_chunks)
+    store = index_manager.build_new_index(force=True)
+
+    assert store.index.ntotal == 200
+    assert {doc.metadata["source"] for doc in store.docstore._dict.values()} == {"good.pdf"}
+    assert set(index_manager.read_manifest(index_manager.current_snapshot_dir())["sources"]) == {"good.pdf"}
+
+
+def test_rollback_pins_the_index_until_a_forced_sync(monkeypatch):
+    documents = make_documents(200, "a.pdf")
+    sources = {"a.pdf": {"sha256": "0" * 64, "chunk_ids": list(documents)}}
+    index_manager.vectorstore = None
+    for count in (200, 180):
+        store = index_manager.rebuild_store(dict(list(documents.items())[:count]))
+        index_manager.publish_snapshot(store, index_manager.build_manifest(sources), force=True)
+    version = index_manager.rollback_index()
+    assert index_manager.pinned_version() == version
+
+    # The file changed since the rolled-back snapshot, so an unpinned sync would republish it
+    monkeypatch.setattr(index_manager, "scan_upload_dir", lambda: ["a.pdf"])
+    monkeypatch.setattr(index_manager, "file_fingerprint", lambda path: "1" * 64)
+    monkeypatch.setattr(index_manager, "iter_file_chunks", lambda path, executor: iter(list(documents.values())[:150]))
+    assert index_manager.apply_upload_changes().index.ntotal == 200
+    assert os.path.basename(index_manager.current_snapshot_dir()) == version
+
+    assert index_manager.apply_upload_changes(force=True).index.ntotal == 150
+    assert index_manager.pinned_version() is None